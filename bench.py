@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import curses
+import fcntl
+import json
+import os
+import platform
+import pty
+import struct
+import sys
+import tempfile
+import termios
+import threading
+import time
+import numpy as np
+
+from cells import CELL_MODES
+from main import TerminalRenderer
+
+
+def synthetic_model(triangles, seed=0):
+    # small colored triangles scattered over a unit sphere
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(triangles, 3))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vertices = centers[:, None, :] + rng.uniform(-0.12, 0.12, size=(triangles, 3, 3))
+    colors = rng.uniform(0, 1, size=(triangles, 3))
+
+    instructions = [{"command": "begin", "args": ["GL_TRIANGLES"]}]
+    for color, tri in zip(np.round(colors, 3).tolist(), np.round(vertices, 4).tolist()):
+        instructions.append({"command": "color3f", "args": color})
+        for vertex in tri:
+            instructions.append({"command": "vertex3f", "args": vertex})
+    instructions.append({"command": "end"})
+    return {"instructions": instructions}
+
+
+class FakeTerminal:
+    # real curses on a pseudo-terminal, output is drained and counted instead of shown
+    def __init__(self, width, height):
+        self.master, self.slave = pty.openpty()
+        fcntl.ioctl(self.slave, termios.TIOCSWINSZ, struct.pack("HHHH", height, width, 0, 0))
+        self.bytes_read = 0
+        self.running = True
+        self.reader = threading.Thread(target=self.drain, daemon=True)
+
+    def drain(self):
+        while self.running:
+            try:
+                self.bytes_read += len(os.read(self.master, 1 << 16))
+            except OSError:
+                break
+
+    def __enter__(self):
+        self.saved = [os.dup(0), os.dup(1)]
+        os.dup2(self.slave, 0)
+        os.dup2(self.slave, 1)
+        os.environ["TERM"] = "xterm-256color"
+        os.environ["LINES"], os.environ["COLUMNS"] = str(self.height), str(self.width)
+        self.reader.start()
+        return self
+
+    def __exit__(self, *exc):
+        with contextlib.suppress(curses.error):
+            curses.endwin()
+        sys.stdout.flush()
+        os.dup2(self.saved[0], 0)
+        os.dup2(self.saved[1], 1)
+        self.running = False
+        os.close(self.slave)
+
+    @property
+    def width(self):
+        return struct.unpack("HHHH", fcntl.ioctl(self.slave, termios.TIOCGWINSZ, b"\0" * 8))[1]
+
+    @property
+    def height(self):
+        return struct.unpack("HHHH", fcntl.ioctl(self.slave, termios.TIOCGWINSZ, b"\0" * 8))[0]
+
+
+def summarize(samples, units=1):
+    ms = np.array(samples) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "per_second": float(units * 1000 / ms.mean()) if ms.mean() > 0 else None,
+    }
+
+
+def timed(stages, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    stages.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def parse_compile(model_renderer, json_data):
+    # the same start/step path the ui loads through, run to completion
+    model_renderer.start((json_data,))
+    model_renderer.step()
+
+
+def run(args):
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    model = synthetic_model(args.triangles, args.seed)
+    json_data = json.dumps(model, indent=2)
+    stages = {}
+    output_bytes = []
+
+    workdir = tempfile.TemporaryDirectory(prefix="bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir.name)
+    try:
+        with open("model.json", "w") as f:
+            f.write(json_data)
+
+        with FakeTerminal(width, height) as term:
+            renderer = TerminalRenderer(output=args.output, colors=args.colors,
+                                        dither=args.dither, backend=args.backend, cells=args.cells,
+                                        tiles=args.tiles, views=args.views)
+            renderer.setup_screen()
+
+            for _ in range(args.parses):
+                timed(stages, "parse_compile", parse_compile, renderer.model_renderer, json_data)
+            renderer.model_revision = renderer.editor.revision
+
+            for frame in range(args.warmup + args.frames):
+                if frame == args.warmup:
+                    stages = {k: v for k, v in stages.items() if k == "parse_compile"}
+                    output_bytes.clear()
+                renderer.advance()
+                timed(stages, "draw_scene", renderer.draw_scene)
+                timed(stages, "render_to_buffer", renderer.render_to_buffer)
+                timed(stages, "display_buffer", renderer.display_buffer)
+                timed(stages, "editor_draw", renderer.editor.draw)
+                timed(stages, "curses_refresh", renderer.stdscr.refresh)
+                pending = len(getattr(renderer.output, "pending", b""))
+                timed(stages, "output_flush", renderer.output.flush)
+                output_bytes.append(pending)
+            total_bytes = term.bytes_read
+    finally:
+        os.chdir(cwd)
+        workdir.cleanup()
+
+    frame_times = np.sum([stages[k] for k in stages if k != "parse_compile"], axis=0)
+    vertices = renderer.model_renderer.compiled_model.vertex_count
+    results = {
+        "config": {
+            "triangles": args.triangles, "vertices": vertices, "size": [width, height],
+            "frames": args.frames, "backend": args.backend, "output": args.output,
+            "colors": args.colors, "dither": args.dither, "cells": args.cells,
+            "tiles": args.tiles, "views": args.views,
+            "model_json_bytes": len(json_data),
+        },
+        "environment": {
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "frame": summarize(frame_times),
+        "output": {
+            "ansi_bytes_per_frame": float(np.mean(output_bytes)) if output_bytes else 0.0,
+            "terminal_bytes_total": total_bytes,
+        },
+    }
+    results["stages"]["draw_scene"]["vertices_per_second"] = \
+        vertices * results["stages"]["draw_scene"]["per_second"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless per-stage frame pipeline benchmark")
+    parser.add_argument("--triangles", type=int, default=2000)
+    parser.add_argument("--size", default="160x50", help="terminal size, WxH cells")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--parses", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["gl", "software"], default="software")
+    parser.add_argument("--output", choices=["ansi", "curses"], default="ansi")
+    parser.add_argument("--colors", choices=["8", "256", "truecolor"], default="256")
+    parser.add_argument("--dither", action="store_true")
+    parser.add_argument("--cells", choices=list(CELL_MODES), default="half")
+    parser.add_argument("--tiles", type=int, default=1)
+    parser.add_argument("--views", type=int, default=1)
+    parser.add_argument("--out", default="bench.json", help="machine readable results")
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'stage':<18}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, s in list(results["stages"].items()) + [("frame", results["frame"])]:
+        print(f"{name:<18}{s['mean_ms']:>9.3f}{s['p50_ms']:>9.3f}{s['p95_ms']:>9.3f}"
+              f"{s['p99_ms']:>9.3f}{s['max_ms']:>9.3f}")
+    print(f"fps ~{results['frame']['per_second']:.1f}, "
+          f"{results['output']['ansi_bytes_per_frame']:.0f} ansi bytes/frame, results in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
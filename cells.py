@@ -0,0 +1,296 @@
+import collections
+import curses
+import numpy as np
+
+
+HALF_BLOCK = ord('▄')
+DEFAULT = -1  # terminal default fg/bg
+
+
+class CellGrid:
+    def __init__(self, height, width):
+        self.resize(height, width)
+
+    def resize(self, height, width):
+        self.height, self.width = height, width
+        self.ch = np.full((height, width), HALF_BLOCK, dtype=np.uint32)
+        self.fg = np.zeros((height, width), dtype=np.int32)
+        self.bg = np.zeros((height, width), dtype=np.int32)
+        # quantized pixel rows, two per cell, reused by the half-block conversion
+        self.colors = np.empty((height * 2, width), dtype=np.int32)
+
+    @classmethod
+    def wrap(cls, ch, fg, bg):
+        # grid over existing arrays, e.g. a region of shared memory
+        grid = cls.__new__(cls)
+        grid.height, grid.width = ch.shape
+        grid.ch, grid.fg, grid.bg = ch, fg, bg
+        grid.colors = None
+        return grid
+
+    def put_text(self, y, x, text, fg=DEFAULT, bg=DEFAULT):
+        if not 0 <= y < self.height or x >= self.width:
+            return
+        text = text[:self.width - x]
+        n = len(text)
+        self.ch[y, x:x + n] = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        self.fg[y, x:x + n] = fg
+        self.bg[y, x:x + n] = bg
+
+    def row_text(self, y, start=0, stop=None):
+        return self.ch[y, start:stop].tobytes().decode('utf-32-le')
+
+
+BASIC_RGB = np.array([[(i & 1) * 205, (i >> 1 & 1) * 205, (i >> 2 & 1) * 205] for i in range(8)])
+CUBE_LEVELS = np.array([0, 95, 135, 175, 215, 255])
+BAYER4 = np.array([[0, 8, 2, 10],
+                   [12, 4, 14, 6],
+                   [3, 11, 1, 9],
+                   [15, 7, 13, 5]]) / 16.0 - 0.5
+
+
+def xterm256_palette():
+    rgb = np.zeros((256, 3), dtype=np.int32)
+    rgb[:8] = BASIC_RGB
+    rgb[8:16] = np.minimum(BASIC_RGB + 50, 255)
+    cube = np.stack(np.meshgrid(CUBE_LEVELS, CUBE_LEVELS, CUBE_LEVELS, indexing='ij'), -1)
+    rgb[16:232] = cube.reshape(-1, 3)
+    rgb[232:] = (8 + 10 * np.arange(24))[:, None]
+    return rgb
+
+
+def quantize8(pixels):
+    # 1 bit per channel -> curses color number (r=1, g=2, b=4)
+    bits = pixels > 127
+    return bits[..., 0] * 1 + bits[..., 1] * 2 + bits[..., 2] * 4
+
+
+def build_lut(mode):
+    # nearest palette entry for every 15-bit (5 bits per channel) color
+    levels = np.arange(32) * 8 + 4
+    rgb = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), -1).reshape(-1, 3)
+    if mode == "8":
+        return quantize8(rgb).astype(np.int32)
+
+    # skip 0-15, their actual colors depend on the terminal theme
+    palette = xterm256_palette()[16:]
+    lut = np.empty(len(rgb), dtype=np.int32)
+    for start in range(0, len(rgb), 4096):
+        chunk = rgb[start:start + 4096, None, :] - palette[None]
+        lut[start:start + 4096] = np.argmin((chunk * chunk).sum(-1), axis=1) + 16
+    return lut
+
+
+class Quantizer:
+    MODES = ("8", "256", "truecolor")
+    # palette spacing, used to scale the dither offset
+    STEP = {"8": 255, "256": 40, "truecolor": 0}
+
+    def __init__(self, mode="256", dither=False):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown color mode {mode!r}")
+        self.mode = mode
+        self.dither = dither and mode != "truecolor"
+        self.lut = None if mode == "truecolor" else build_lut(mode)
+        self.bayer = None
+        self.scratch = None
+
+    def basic_color(self, color):
+        # basic curses color number in this mode's encoding
+        if self.mode != "truecolor" or color < 0:
+            return color
+        r, g, b = BASIC_RGB[color]
+        return int(r) << 16 | int(g) << 8 | int(b)
+
+    def dither_offsets(self, height, width):
+        if self.bayer is None or self.bayer.shape[:2] != (height, width):
+            tiled = np.tile(BAYER4, (height // 4 + 1, width // 4 + 1))[:height, :width]
+            # per channel up front, a broadcast add would go through a temporary
+            self.bayer = np.repeat((tiled * self.STEP[self.mode]).astype(np.intp)[..., None], 3, axis=2)
+        return self.bayer
+
+    def planes(self, height, width):
+        # working copies, kept while the frame size stays the same; take() wants intp indices
+        if self.scratch is None or self.scratch[1].shape != (height, width):
+            self.scratch = (np.empty((height, width, 3), dtype=np.intp),
+                            np.empty((height, width), dtype=np.intp))
+        return self.scratch
+
+    def __call__(self, pixels, out=None):
+        height, width = pixels.shape[:2]
+        if out is None:
+            out = np.empty((height, width), dtype=np.int32)
+        p, index = self.planes(height, width)
+        np.copyto(p, pixels)
+        if self.mode == "truecolor":
+            np.left_shift(p[..., 0], 16, out=index)
+            p[..., 1] <<= 8
+            index |= p[..., 1]
+            index |= p[..., 2]
+            np.copyto(out, index, casting="unsafe")
+            return out
+
+        if self.dither:
+            p += self.dither_offsets(height, width)
+            np.clip(p, 0, 255, out=p)
+        p >>= 3
+        np.left_shift(p[..., 0], 10, out=index)
+        p[..., 1] <<= 5
+        index |= p[..., 1]
+        index |= p[..., 2]
+        # mode="clip" writes straight into out, "raise" would buffer a copy first
+        return np.take(self.lut, index, out=out, mode="clip")
+
+
+def resample_nearest(pixel_array, height, width):
+    # nearest-neighbour fit of a reduced resolution framebuffer onto the cell grid
+    src_h, src_w = pixel_array.shape[:2]
+    if (src_h, src_w) == (height, width):
+        return pixel_array
+    rows = np.arange(height) * src_h // height
+    cols = np.arange(width) * src_w // width
+    return pixel_array[rows[:, None], cols]
+
+
+class Resampler:
+    # resample_nearest into a reused buffer, the gather indices are kept per size pair
+    def __init__(self):
+        self.key = None
+
+    def __call__(self, pixel_array, height, width):
+        src_h, src_w = pixel_array.shape[:2]
+        if (src_h, src_w) == (height, width):
+            return pixel_array
+        if self.key != (src_h, src_w, height, width):
+            self.key = (src_h, src_w, height, width)
+            rows = np.arange(height) * src_h // height
+            cols = np.arange(width) * src_w // width
+            self.index = rows[:, None] * src_w + cols
+            self.out = np.empty((height, width, 3), dtype=np.uint8)
+        return np.take(pixel_array.reshape(-1, 3), self.index, axis=0, out=self.out, mode="clip")
+
+
+# sub-cell layouts: pixels per cell as (columns, rows)
+CELL_MODES = {"half": (1, 2), "quadrant": (2, 2), "braille": (2, 4)}
+
+# glyph for each bit mask of lit sub-pixels, bits in row-major sub-pixel order
+QUADRANT_GLYPHS = np.array([ord(c) for c in " ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█"], dtype=np.uint32)
+BRAILLE_BITS = np.array([0x01, 0x08, 0x02, 0x10, 0x04, 0x20, 0x40, 0x80], dtype=np.uint32)
+
+
+def framebuffer_to_cells(pixel_array, grid, quantizer, mode="half"):
+    # pixel_array is top-down (gl_height, gl_width, 3); two pixel rows per cell
+    if mode != "half":
+        return subcells_to_cells(pixel_array, grid, quantizer, mode)
+    h = min(grid.height, pixel_array.shape[0] // 2)
+    w = min(grid.width, pixel_array.shape[1])
+
+    colors = quantizer(pixel_array[:h * 2, :w], out=None if grid.colors is None else grid.colors[:h * 2, :w])
+    grid.ch[:h, :w] = HALF_BLOCK
+    grid.bg[:h, :w] = colors[0::2]
+    grid.fg[:h, :w] = colors[1::2]
+    return grid
+
+
+def subcells_to_cells(pixel_array, grid, quantizer, mode):
+    # two-color split of every cell at once: threshold the channel with the widest
+    # range at its midpoint, lit sub-pixels pick the glyph and average into fg, the rest into bg
+    cw, ch = CELL_MODES[mode]
+    n = cw * ch
+    h = min(grid.height, pixel_array.shape[0] // ch)
+    w = min(grid.width, pixel_array.shape[1] // cw)
+    # (sub-pixel, h, w, channel): reductions over sub-pixels are plain elementwise ops on planes
+    cells = pixel_array[:h * ch, :w * cw].reshape(h, ch, w, cw, 3).transpose(1, 3, 0, 2, 4)
+    cells = cells.reshape(n, h, w, 3).astype(np.uint16)
+
+    lo, hi = cells.min(axis=0), cells.max(axis=0)
+    spread = hi - lo
+    channel = np.where(spread[..., 0] >= spread[..., 1], 0, 1)
+    channel = np.where(spread[..., 2] > np.maximum(spread[..., 0], spread[..., 1]), 2, channel)
+    rows, cols = np.indices((h, w), sparse=True)
+    values = cells[:, rows, cols, channel]
+    lit = values * 2 > lo[rows, cols, channel] + hi[rows, cols, channel]
+
+    count = lit.sum(axis=0, dtype=np.uint16)[..., None]
+    lit_sum = (cells * lit[..., None]).sum(axis=0, dtype=np.uint16)
+    total = cells.sum(axis=0, dtype=np.uint16)
+    fg = lit_sum // np.maximum(count, 1)
+    bg = (total - lit_sum) // np.maximum(n - count, 1)
+    # flat cells have nothing lit, give fg the same color
+    fg = np.where(count > 0, fg, bg)
+
+    if mode == "quadrant":
+        glyphs = QUADRANT_GLYPHS[np.tensordot(1 << np.arange(4, dtype=np.uint32), lit, axes=1)]
+    else:
+        glyphs = 0x2800 + np.tensordot(BRAILLE_BITS, lit, axes=1)
+
+    grid.ch[:h, :w] = glyphs
+    grid.fg[:h, :w] = quantizer(fg.astype(np.uint8))
+    grid.bg[:h, :w] = quantizer(bg.astype(np.uint8))
+    return grid
+
+
+class PairAllocator:
+    # curses color pairs for 256-color mode; 1-63 stay the fixed 8-color pairs
+    # and 100 is the editor's cursor pair, so scene colors start above it
+    def __init__(self, first=101):
+        self.first = first
+        # color_pair() only encodes 8 bits, anything above 255 would draw as another pair
+        self.limit = min(curses.COLOR_PAIRS, 256)
+        self.pairs = collections.OrderedDict()  # least recently used first
+        self.used = set()
+        self.next_pair = first
+        self.to_basic = quantize8(xterm256_palette())
+
+    def __call__(self, grid):
+        # the whole pane is redrawn every frame, so only pairs this frame uses are on screen
+        self.used = set()
+        fg = grid.fg.astype(np.int64)
+        bg = grid.bg.astype(np.int64)
+        keys, inverse = np.unique((fg + 1) * 257 + (bg + 1), return_inverse=True)
+        mapped = np.empty(len(keys), dtype=np.int32)
+        for i, key in enumerate(keys.tolist()):
+            mapped[i] = self.pair_for(key // 257 - 1, key % 257 - 1)
+        return mapped[inverse.reshape(fg.shape)]
+
+    def pair_for(self, fg, bg):
+        pair = self.pairs.get((fg, bg))
+        if pair is not None:
+            self.pairs.move_to_end((fg, bg))
+            self.used.add(pair)
+            return pair
+        if fg < 0 or bg < 0:
+            return 0
+        if self.next_pair < self.limit:
+            pair = self.next_pair
+            self.next_pair += 1
+        elif self.pairs and next(iter(self.pairs.values())) not in self.used:
+            # table full, redefine the least recently used pair
+            _, pair = self.pairs.popitem(last=False)
+        else:
+            # every pair is on screen this frame, fall back to the nearest basic pair
+            basic_fg, basic_bg = int(self.to_basic[fg]), int(self.to_basic[bg])
+            return min(basic_bg * 8 + basic_fg + 1, 63)
+
+        curses.init_pair(pair, fg, bg)
+        self.pairs[(fg, bg)] = pair
+        self.used.add(pair)
+        return pair
+
+
+def pair_indices(grid):
+    # same layout as init_color_pairs: bg * 8 + fg + 1, pair 0 for default colors
+    pairs = grid.bg * 8 + grid.fg + 1
+    np.minimum(pairs, 63, out=pairs)
+    pairs[(grid.fg < 0) | (grid.bg < 0)] = 0
+    return pairs
+
+
+def row_runs(row):
+    # [(start, stop, value)] for runs of equal values in a 1d array
+    if not len(row):
+        return []
+    edges = np.flatnonzero(row[1:] != row[:-1]) + 1
+    starts = np.concatenate(([0], edges))
+    stops = np.concatenate((edges, [len(row)]))
+    return list(zip(starts.tolist(), stops.tolist(), row[starts].tolist()))
@@ -0,0 +1,251 @@
+import numpy as np
+
+from mesh import CLUSTER, VERTS_PER, Batch, Mesh
+
+
+def frustum_planes(clip):
+    # (6, 4) planes from a clip matrix, a*x + b*y + c*z + d >= 0 is inside (Gribb & Hartmann)
+    m = np.asarray(clip, dtype=np.float64)
+    return np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+
+
+def transform_boxes(lo, hi, transforms):
+    # world boxes around (lo, hi) under each (k, 4, 4) transform
+    corners = np.stack(np.meshgrid(*zip(lo, hi), indexing="ij"), -1).reshape(8, 3)
+    points = corners @ transforms[:, :3, :3].transpose(0, 2, 1) + transforms[:, None, :3, 3]
+    return points.min(axis=1), points.max(axis=1)
+
+
+def cluster_cones(vertices, starts):
+    # per cluster of triangles: mean facing axis and the sine of the widest deviation from it;
+    # clusters that face more than 90 degrees apart get a cutoff no view can reach
+    tri = vertices.reshape(-1, 3, 3).astype(np.float64)
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.where(lengths > 0, normals / np.where(lengths > 0, lengths, 1), 0)
+    axes = np.add.reduceat(normals, starts)
+    axes /= np.maximum(np.linalg.norm(axes, axis=1, keepdims=True), 1e-12)
+    owner = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(tri))))
+    spread = np.minimum.reduceat((normals * axes[owner]).sum(1), starts)
+    cutoff = np.where(spread > 0, np.sqrt(1 - np.minimum(spread, 1) ** 2), 2.0)
+    return axes, cutoff
+
+
+def expand(first, last):
+    # concatenated aranges first[i]:last[i]
+    lengths = last - first
+    return np.repeat(first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+def outside_planes(lo, hi, planes):
+    # boxes entirely on the outer side of at least one plane, and boxes inside all of them
+    normals, offsets = planes[:, :3], planes[:, 3]
+    positive = normals >= 0
+    far = np.where(positive, hi[:, None], lo[:, None])
+    near = np.where(positive, lo[:, None], hi[:, None])
+    outside = ((far * normals).sum(-1) + offsets < 0).any(axis=1)
+    inside = ((near * normals).sum(-1) + offsets >= 0).all(axis=1)
+    return outside, inside
+
+
+class CullIndex:
+    # bounding volume hierarchy over the culling items of one mesh: runs of CLUSTER consecutive
+    # primitives of a batch (MeshBuilder orders them so runs are compact), and single instances
+    # of instanced batches. Nothing is copied, visible runs stay array views.
+    LEAF = 8
+
+    def __init__(self, mesh, sliced=False):
+        # sliced: nothing is done yet, steps() builds it a batch at a time
+        self.mesh = mesh
+        self.ready = False
+        if not sliced:
+            for _ in self.steps():
+                pass
+
+    def steps(self):
+        lo, hi, axes, cutoff, counts = [], [], [], [], []
+        self.spans = []
+        for batch in self.mesh.batches:
+            start = sum(len(c) for c in counts)
+            vertices = np.asarray(batch.vertices, dtype=np.float32)
+            if batch.instances is not None:
+                b_lo, b_hi = transform_boxes(vertices.min(axis=0), vertices.max(axis=0), batch.transforms())
+                n = len(b_lo)
+                axes.append(np.zeros((n, 3)))
+                cutoff.append(np.full(n, 2.0))
+                counts.append(np.full(n, len(batch) // VERTS_PER[batch.primitive]))
+            else:
+                k = VERTS_PER[batch.primitive]
+                prims = len(batch) // k
+                starts = np.arange(0, prims, CLUSTER)
+                b_lo = np.minimum.reduceat(vertices, starts * k, axis=0)
+                b_hi = np.maximum.reduceat(vertices, starts * k, axis=0)
+                n = len(starts)
+                counts.append(np.minimum(starts + CLUSTER, prims) - starts)
+                if batch.primitive == "triangles" and batch.matrix is None:
+                    cone_axes, cone_cutoff = cluster_cones(vertices, starts)
+                    axes.append(cone_axes)
+                    cutoff.append(cone_cutoff)
+                else:
+                    axes.append(np.zeros((n, 3)))
+                    cutoff.append(np.full(n, 2.0))
+                if batch.matrix is not None:
+                    boxes = [transform_boxes(l, h, np.asarray(batch.matrix)[None]) for l, h in zip(b_lo, b_hi)]
+                    b_lo = np.array([b[0][0] for b in boxes])
+                    b_hi = np.array([b[1][0] for b in boxes])
+            lo.append(np.asarray(b_lo, dtype=np.float64))
+            hi.append(np.asarray(b_hi, dtype=np.float64))
+            self.spans.append((start, start + n))
+            yield
+
+        empty = np.zeros((0, 3))
+        self.lo = np.concatenate(lo) if lo else empty
+        self.hi = np.concatenate(hi) if hi else empty
+        self.axes = np.concatenate(axes) if axes else empty
+        self.cutoff = np.concatenate(cutoff) if cutoff else np.zeros(0)
+        self.counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+        self.center = (self.lo + self.hi) / 2
+        self.radius = np.linalg.norm(self.hi - self.lo, axis=1) / 2
+        self.build()
+        self.ready = True
+
+    def build(self):
+        # median split on the longest axis down to LEAF items per leaf; a node covers
+        # order[first:last], children are stored as node indices, -1 for leaves
+        n = len(self.lo)
+        self.order = np.arange(n)
+        node_lo, node_hi, first, last, left, right = [], [], [], [], [], []
+        stack = [(0, n, -1, 0)] if n else []
+        while stack:
+            start, stop, parent, side = stack.pop()
+            node = len(first)
+            if parent >= 0:
+                (left if side == 0 else right)[parent] = node
+            items = self.order[start:stop]
+            node_lo.append(self.lo[items].min(axis=0))
+            node_hi.append(self.hi[items].max(axis=0))
+            first.append(start)
+            last.append(stop)
+            left.append(-1)
+            right.append(-1)
+            if stop - start > self.LEAF:
+                centers = self.center[items]
+                axis = int(np.argmax(centers.max(axis=0) - centers.min(axis=0)))
+                mid = (stop - start) // 2
+                self.order[start:stop] = items[np.argpartition(centers[:, axis], mid)]
+                stack.append((start + mid, stop, node, 1))
+                stack.append((start, start + mid, node, 0))
+        self.node_lo = np.array(node_lo).reshape(-1, 3)
+        self.node_hi = np.array(node_hi).reshape(-1, 3)
+        self.first = np.array(first, dtype=np.int64)
+        self.last = np.array(last, dtype=np.int64)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+
+    def frustum(self, planes):
+        # items whose box is not fully outside one plane; whole subtrees are taken or
+        # dropped as soon as a node is entirely inside or outside, leaves cut by a plane
+        # test their items one by one
+        n = len(self.lo)
+        marks = np.zeros(n + 1, dtype=np.int64)
+        frontier = np.zeros(1 if n else 0, dtype=np.int64)
+        partial = []
+        while len(frontier):
+            outside, inside = outside_planes(self.node_lo[frontier], self.node_hi[frontier], planes)
+            leaf = self.left[frontier] < 0
+            take = frontier[~outside & inside]
+            np.add.at(marks, self.first[take], 1)
+            np.add.at(marks, self.last[take], -1)
+            partial.append(frontier[~outside & ~inside & leaf])
+            split = frontier[~outside & ~inside & ~leaf]
+            frontier = np.concatenate((self.left[split], self.right[split]))
+        visible = np.zeros(n, dtype=bool)
+        visible[self.order] = np.cumsum(marks[:n]) > 0
+        if partial:
+            leaves = np.concatenate(partial)
+            items = self.order[expand(self.first[leaves], self.last[leaves])]
+            outside, _ = outside_planes(self.lo[items], self.hi[items], planes)
+            visible[items[~outside]] = True
+        return visible
+
+    def backfacing(self, eye):
+        # whole clusters facing away from the eye (cone test against the bounding sphere)
+        offset = self.center - eye
+        distance = np.linalg.norm(offset, axis=1)
+        return (offset * self.axes).sum(1) >= self.cutoff * distance + self.radius
+
+
+class Culler:
+    # per frame: submit only the items inside the view frustum, optionally without clusters
+    # facing away; indexes are kept for the last few meshes, lod levels swap between them
+    KEEP = 4
+
+    def __init__(self, backfaces=False):
+        self.backfaces = backfaces
+        self.indexes = {}
+        self.index = None
+        self.key = None
+        self.culled_mesh = None
+        self.stats = None
+
+    def cull(self, mesh, projection, modelview):
+        if mesh is None:
+            self.stats = None
+            return None
+        if self.index is None or self.index.mesh is not mesh:
+            index = self.indexes.get(id(mesh))
+            if index is None or index.mesh is not mesh or not index.ready:
+                index = self.remember(CullIndex(mesh))
+            self.index = index
+            self.key = None
+        index = self.index
+        visible = index.frustum(frustum_planes(projection @ modelview))
+        if self.backfaces:
+            eye = np.linalg.inv(modelview)[:3, 3]
+            visible &= ~index.backfacing(eye)
+
+        shown = int(visible.sum())
+        self.stats = (shown, len(visible) - shown, int(index.counts[visible].sum()), int(index.counts.sum()))
+        key = visible.tobytes()
+        if key != self.key:
+            self.key = key
+            self.culled_mesh = self.assemble(visible)
+        return self.culled_mesh
+
+    def remember(self, index):
+        self.indexes.pop(id(index.mesh), None)
+        if len(self.indexes) >= self.KEEP:
+            self.indexes.pop(next(iter(self.indexes)))
+        self.indexes[id(index.mesh)] = index
+        return index
+
+    def prepare(self, mesh):
+        # index a new model in slices, for the model loader to run before publishing it
+        index = CullIndex(mesh, sliced=True)
+        yield from index.steps()
+        self.remember(index)
+
+    def assemble(self, visible):
+        batches = []
+        for batch, (start, stop) in zip(self.index.mesh.batches, self.index.spans):
+            shown = visible[start:stop]
+            if shown.all():
+                batches.append(batch)
+            elif not shown.any():
+                continue
+            elif batch.instances is not None:
+                batches.append(Batch(batch.primitive, batch.vertices, batch.colors, batch.normals,
+                                     batch.matrix, batch.instances[shown]))
+            else:
+                # consecutive visible clusters go out as one view of the batch arrays
+                edges = np.flatnonzero(np.diff(np.concatenate(([0], shown.view(np.int8), [0]))))
+                step = CLUSTER * VERTS_PER[batch.primitive]
+                for run_start, run_stop in zip(edges[0::2], edges[1::2]):
+                    s = slice(run_start * step, run_stop * step)
+                    batches.append(Batch(batch.primitive, batch.vertices[s], batch.colors[s],
+                                         None if batch.normals is None else batch.normals[s], batch.matrix))
+        return Mesh(batches)
+
+    def label(self):
+        shown, culled, prims, total = self.stats
+        return f"Cull: {shown} visible, {culled} culled ({prims}/{total} primitives)"
@@ -1,8 +1,9 @@
 import curses
-import os
-import json
 import time
-from OpenGL.GL import *
+from jsonstream import iter_model
+from mesh import MeshBuilder
+from textbuffer import TextBuffer
+from watcher import FileWatcher
 
 
 class TextEditor:
@@ -11,33 +12,61 @@ class TextEditor:
         self.start_x = start_x
         self.width = width
         self.height = height
-        self.content = []
+        self.content = TextBuffer()
         self.cursor_y = self.cursor_x = self.scroll_y = 0
         self.filename = "model.json"
         self.status_message = ""
-        self.status_time = self.last_mod_time = 0
+        self.status_time = 0
+        
+        # bumped on every content change, lets the renderer skip re-parsing
+        self.revision = 0
+        self.last_edit_time = 0
+        
+        # what each screen row currently shows, only rows that differ get repainted
+        self.drawn_rows = {}
+        self.drawn_status = None
+        self.drawn_size = None
+        curses.init_pair(100, curses.COLOR_WHITE, curses.COLOR_BLACK)
         
         self.load_file()
+        self.watcher = FileWatcher(self.filename, loader=TextBuffer)
     
     def load_file(self):
-        with open("model.json", 'r') as f:
-            self.content = f.read().split('\n')
-        self.last_mod_time = os.path.getmtime("model.json")
+        with open(self.filename, 'r') as f:
+            self.set_content(TextBuffer(f.read()))
+    
+    def set_content(self, content):
+        self.content = content
+        self.cursor_y = min(self.cursor_y, len(self.content) - 1)
+        self.cursor_x = min(self.cursor_x, self.content.line_length(self.cursor_y))
+        self.revision += 1
+        self.last_edit_time = 0  # reloads skip the typing debounce
         self.set_status(f"loaded model from file")
     
     def save_file(self):
         with open(self.filename, 'w') as f:
-            f.write('\n'.join(self.content))
-        self.last_mod_time = os.path.getmtime(self.filename)
+            f.write(self.content.text())
+        self.watcher.ignore_current()
         self.set_status(f"saved model to file")
         return True
     
     def check_file_changed(self):
-        mod_time = os.path.getmtime(self.filename)
-        if mod_time > self.last_mod_time:
-            self.load_file()
+        # the watcher thread has already read the whole file, no syscalls here; our own
+        # saves are never handed over (ignore_current), so there is nothing to compare
+        content = self.watcher.take()
+        if content is not None:
+            self.set_content(content)
             return True
     
+    def mark_edited(self):
+        self.revision += 1
+        self.last_edit_time = time.time()
+    
+    def view_state(self):
+        status_visible = time.time() - self.status_time < 3
+        return (self.revision, self.cursor_y, self.cursor_x, self.scroll_y,
+                self.status_message if status_visible else None)
+    
     def set_status(self, message):
         self.status_message = message
         self.status_time = time.time()
@@ -46,78 +75,70 @@ class TextEditor:
         if key == curses.KEY_UP:
             if self.cursor_y > 0:
                 self.cursor_y -= 1
-                if self.cursor_x > len(self.content[self.cursor_y]):
-                    self.cursor_x = len(self.content[self.cursor_y])
+                if self.cursor_x > self.content.line_length(self.cursor_y):
+                    self.cursor_x = self.content.line_length(self.cursor_y)
         elif key == curses.KEY_DOWN:
             if self.cursor_y < len(self.content) - 1:
                 self.cursor_y += 1
-                if self.cursor_x > len(self.content[self.cursor_y]):
-                    self.cursor_x = len(self.content[self.cursor_y])
+                if self.cursor_x > self.content.line_length(self.cursor_y):
+                    self.cursor_x = self.content.line_length(self.cursor_y)
         elif key == curses.KEY_LEFT:
             if self.cursor_x > 0:
                 self.cursor_x -= 1
             elif self.cursor_y > 0:
                 self.cursor_y -= 1
-                self.cursor_x = len(self.content[self.cursor_y])
+                self.cursor_x = self.content.line_length(self.cursor_y)
         elif key == curses.KEY_RIGHT:
-            if self.cursor_x < len(self.content[self.cursor_y]):
+            if self.cursor_x < self.content.line_length(self.cursor_y):
                 self.cursor_x += 1
             elif self.cursor_y < len(self.content) - 1:
                 self.cursor_y += 1
                 self.cursor_x = 0
         elif key in (curses.KEY_BACKSPACE, 8, 127):
             if self.cursor_x > 0:
-                self.content[self.cursor_y] = (
-                    self.content[self.cursor_y][:self.cursor_x-1] + 
-                    self.content[self.cursor_y][self.cursor_x:]
-                )
+                self.content.delete(self.cursor_y, self.cursor_x - 1)
                 self.cursor_x -= 1
+                self.mark_edited()
             elif self.cursor_y > 0:
-                prev_line_len = len(self.content[self.cursor_y-1])
-                self.content[self.cursor_y-1] += self.content[self.cursor_y]
-                self.content.pop(self.cursor_y)
+                prev_line_len = self.content.line_length(self.cursor_y-1)
+                self.content.delete(self.cursor_y - 1, prev_line_len)
                 self.cursor_y -= 1
                 self.cursor_x = prev_line_len
+                self.mark_edited()
         elif key == curses.KEY_DC:
-            if self.cursor_x < len(self.content[self.cursor_y]):
-                self.content[self.cursor_y] = (
-                    self.content[self.cursor_y][:self.cursor_x] + 
-                    self.content[self.cursor_y][self.cursor_x+1:]
-                )
+            if self.cursor_x < self.content.line_length(self.cursor_y):
+                self.content.delete(self.cursor_y, self.cursor_x)
+                self.mark_edited()
             elif self.cursor_y < len(self.content) - 1:
-                self.content[self.cursor_y] += self.content[self.cursor_y+1]
-                self.content.pop(self.cursor_y+1)
+                self.content.delete(self.cursor_y, self.cursor_x)
+                self.mark_edited()
         elif key == curses.KEY_HOME:
             self.cursor_x = 0
         elif key == curses.KEY_END:
-            self.cursor_x = len(self.content[self.cursor_y])
+            self.cursor_x = self.content.line_length(self.cursor_y)
         elif key == curses.KEY_PPAGE:
             self.cursor_y = max(0, self.cursor_y - (self.height - 2))
             self.scroll_y = max(0, self.scroll_y - (self.height - 2))
-            if self.cursor_x > len(self.content[self.cursor_y]):
-                self.cursor_x = len(self.content[self.cursor_y])
+            if self.cursor_x > self.content.line_length(self.cursor_y):
+                self.cursor_x = self.content.line_length(self.cursor_y)
         elif key == curses.KEY_NPAGE:
             self.cursor_y = min(len(self.content) - 1, self.cursor_y + (self.height - 2))
             if self.cursor_y >= self.scroll_y + (self.height - 2):
                 self.scroll_y = max(0, self.cursor_y - (self.height - 3))
-            if self.cursor_x > len(self.content[self.cursor_y]):
-                self.cursor_x = len(self.content[self.cursor_y])
+            if self.cursor_x > self.content.line_length(self.cursor_y):
+                self.cursor_x = self.content.line_length(self.cursor_y)
         elif key in (10, 13): # ent
-            new_line = self.content[self.cursor_y][self.cursor_x:]
-            self.content[self.cursor_y] = self.content[self.cursor_y][:self.cursor_x]
-            self.content.insert(self.cursor_y + 1, new_line)
+            self.content.insert(self.cursor_y, self.cursor_x, '\n')
             self.cursor_y += 1
             self.cursor_x = 0
+            self.mark_edited()
         elif key == 19:  return self.save_file()
         elif 32 <= key <= 126:  # printable
             try:
                 char = chr(key)
-                self.content[self.cursor_y] = (
-                    self.content[self.cursor_y][:self.cursor_x] + 
-                    char + 
-                    self.content[self.cursor_y][self.cursor_x:]
-                )
+                self.content.insert(self.cursor_y, self.cursor_x, char)
                 self.cursor_x += 1
+                self.mark_edited()
             except Exception as e:
                 self.set_status(str(e))
         
@@ -129,58 +150,83 @@ class TextEditor:
         
         return False
             
+    def invalidate(self):
+        self.drawn_rows = {}
+        self.drawn_status = None
+    
+    def resize(self, start_x, width, height):
+        self.start_x, self.width, self.height = start_x, width, height
+        if self.cursor_y >= self.scroll_y + self.height - 2:
+            self.scroll_y = max(0, self.cursor_y - self.height + 3)
+        self.invalidate()
+    
     def draw(self):
+        if self.drawn_size != (curses.LINES, curses.COLS):
+            self.drawn_size = (curses.LINES, curses.COLS)
+            self.invalidate()
+        
         # slider
-        for i in range(self.height):
-            try:
-                self.stdscr.addstr(i, self.start_x, "│")
-            except curses.error:
-                pass
+        if not self.drawn_rows:
+            for i in range(self.height):
+                try:
+                    self.stdscr.addstr(i, self.start_x, "│")
+                except curses.error:
+                    pass
         
-
+        max_width = min(self.width - 1, curses.COLS - self.start_x - 2)
         display_height = self.height - 1
         for i in range(display_height):
+            line_num = i + self.scroll_y
+            displayed_line = None
+            if 0 <= line_num < len(self.content):
+                # only the visible prefix is pulled out of the buffer
+                line = self.content.line(line_num, limit=max_width + 1)
+                displayed_line = line[:max_width - 1] + "…" if len(line) > max_width else line
+            cursor = self.cursor_x if line_num == self.cursor_y else None
+            
+            row = (displayed_line, cursor)
+            if self.drawn_rows.get(i) == row:
+                continue
+            self.drawn_rows[i] = row
+            
             try:
                 self.stdscr.addstr(i, self.start_x + 1, " " * (self.width - 1))
             except curses.error:
                 pass
+            if displayed_line is None:
+                continue
                 
-            line_num = i + self.scroll_y
-            if 0 <= line_num < len(self.content):
-                line = self.content[line_num]
-                max_width = min(self.width - 1, curses.COLS - self.start_x - 2)
-                displayed_line = line[:max_width - 1] + "…" if len(line) > max_width else line
-                    
+            try:
+                self.stdscr.addstr(i, self.start_x + 1, displayed_line)
+            except curses.error:
+                pass
+            
+            # highlight
+            if cursor is not None:
                 try:
-                    self.stdscr.addstr(i, self.start_x + 1, displayed_line)
+                    self.stdscr.chgat(i, self.start_x + 1, min(len(displayed_line), max_width), 
+                                    curses.A_REVERSE)
+                                    
+                    # cur char TODO
+                    if self.cursor_x < len(displayed_line):
+                        try:
+                            char_to_highlight = displayed_line[self.cursor_x:self.cursor_x+1]
+                            self.stdscr.addstr(i, self.start_x + 1 + self.cursor_x, char_to_highlight, 
+                                            curses.color_pair(100) | curses.A_REVERSE | curses.A_BOLD)
+                        except curses.error:
+                            pass
                 except curses.error:
                     pass
-                
-                # highlight
-                if line_num == self.cursor_y:
-                    try:
-                        self.stdscr.chgat(i, self.start_x + 1, min(len(displayed_line), max_width), 
-                                        curses.A_REVERSE)
-                                        
-                        # cur char TODO
-                        if self.cursor_x < len(displayed_line):
-                            try:
-                                curses.init_pair(100, curses.COLOR_WHITE, curses.COLOR_BLACK)
-                                char_to_highlight = displayed_line[self.cursor_x:self.cursor_x+1]
-                                self.stdscr.addstr(i, self.start_x + 1 + self.cursor_x, char_to_highlight, 
-                                                curses.color_pair(100) | curses.A_REVERSE | curses.A_BOLD)
-                            except curses.error:
-                                pass
-                    except curses.error:
-                        pass
         
         # statuus
-        if time.time() - self.status_time < 3:
+        status = self.status_message if time.time() - self.status_time < 3 else ""
+        if status != self.drawn_status:
+            self.drawn_status = status
             status_y = min(self.height - 1, curses.LINES - 1)
             status_x = self.start_x + 1
             try:
                 max_width = min(self.width - 1, curses.COLS - status_x - 1)
-                self.stdscr.addstr(status_y, status_x, self.status_message[:max_width])
+                self.stdscr.addstr(status_y, status_x, status[:max_width].ljust(max_width))
             except curses.error:
                 pass
         
@@ -190,102 +236,80 @@ class TextEditor:
         
         if 0 <= cursor_screen_y < min(self.height - 1, curses.LINES
         ) and 0 <= cursor_screen_x < curses.COLS:
-            self.stdscr.move(cursor_screen_y, cursor_screen_x)
+            try:
+                self.stdscr.move(cursor_screen_y, cursor_screen_x)
+            except curses.error:
+                pass
 
 
 class JsonModelRenderer:
-    def __init__(self):
-        self.gl_modes = {
-            "GL_POINTS": GL_POINTS,
-            "GL_LINES": GL_LINES,
-            "GL_LINE_STRIP": GL_LINE_STRIP,
-            "GL_LINE_LOOP": GL_LINE_LOOP,
-            "GL_TRIANGLES": GL_TRIANGLES,
-            "GL_TRIANGLE_STRIP": GL_TRIANGLE_STRIP,
-            "GL_TRIANGLE_FAN": GL_TRIANGLE_FAN,
-            "GL_QUADS": GL_QUADS,
-            "GL_QUAD_STRIP": GL_QUAD_STRIP,
-            "GL_POLYGON": GL_POLYGON
-        }
-        
-        self.gl_commands = {
-            "rotate3f": glRotatef,
-            "translate3f": glTranslatef,
-            "scale3f": glScalef,
-            "begin": self._begin,
-            "end": glEnd,
-            "vertex3f": glVertex3f,
-            "color3f": glColor3f,
-            "normal3f": glNormal3f
-        }
-        
-        self.last_model_hash = None
+    # models are parsed and compiled a slice at a time; while a load runs,
+    # compiled_model is a snapshot of the geometry read so far
+    publish_interval = 0.25
+
+    def __init__(self, base_dir=None):
+        # directory of the model file, relative mesh_file paths resolve against it
+        self.base_dir = base_dir
         self.compiled_model = None
+        self.last_valid_model = None
         self.error_message = ""
-        self.last_valid_model = {"instructions": []}
-        self.last_valid_json = json.dumps(self.last_valid_model)
-    
-    def _begin(self, mode_str):
-        glBegin(self.gl_modes.get(mode_str, GL_TRIANGLES))
-    
-    def render(self, json_data, angle=0.0):
-        current_hash = hash(json_data)
-        
-        # use compiled
-        if current_hash == self.last_model_hash and self.compiled_model:
-            glPushMatrix()
-            glRotatef(angle, 0.0, 1.0, 0.0)
-            self.execute(self.compiled_model)
-            glPopMatrix()
-            return True
-        
-        try:
-            model = json.loads(json_data)
-            instructions = model.get("instructions", [])
-            
-            # update model n hash
-            self.compiled_model = instructions
-            self.last_model_hash = current_hash
-            self.error_message = ""
-            
-            self.last_valid_model = model
-            self.last_valid_json = json_data
-            
+        self.loader = None
+        self.builder = None
+        self.generation = 0
+        # optional generator function run on each finished model before it goes up, in slices
+        self.prepare = None
 
+    @property
+    def loading(self):
+        return self.loader is not None
 
+    def start(self, chunks):
+        # begin loading json text given as an iterable of chunks; step() does the work
+        self.builder = MeshBuilder(base_dir=self.base_dir)
+        self.loader = self.load(iter_model(chunks))
+        self.published = time.perf_counter()
 
-            # execute
-            glPushMatrix()
-            glRotatef(angle, 0.0, 1.0, 0.0)
-            self.execute(instructions)
-            glPopMatrix()
-            
-            return True
-
-        except json.JSONDecodeError as je: self.error_message = str(je)
-        except Exception            as e:  self.error_message = str(e )
-        # use last valid
-        
-
-        if self.compiled_model:
-            glPushMatrix()
-            glRotatef(angle, 0.0, 1.0, 0.0)
-            self.execute(self.compiled_model)
-            glPopMatrix()
-            return False  # false = err
-            
-        return False
-
-
+    def load(self, items):
+        for key, value in items:
+            self.builder.feed(key, value)
+            yield
+            # a sealed batch is ordered for culling right away, in slices like the parsing
+            yield from self.builder.order()
+        self.builder.close()
+        yield from self.builder.order()
+        model = self.builder.build()
+        self.builder = None
+        if self.prepare is not None:
+            yield from self.prepare(model)
+        self.publish(model)
+        self.last_valid_model = self.compiled_model
+        self.error_message = ""
 
-    def execute(self, instructions):
-        for instruction in instructions:
-            command = instruction.get("command")
-            args = instruction.get("args", [])
-            
-            if command in self.gl_commands:
+    def publish(self, model):
+        self.compiled_model = model
+        self.generation += 1
+        self.published = time.perf_counter()
 
-                if command == "begin" and args:
-                    self.gl_commands[command](args[0])
-                else:
-                    self.gl_commands[command](*args)
\ No newline at end of file
+    def step(self, budget=None):
+        # work on the current load for about budget seconds; True once it is over
+        if self.loader is None:
+            return True
+        deadline = None if budget is None else time.perf_counter() + budget
+        try:
+            for _ in self.loader:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+            else:
+                self.loader = self.builder = None
+                return True
+            # snapshots resolve named meshes too, a bad definition fails here like anywhere else
+            if self.builder is not None and time.perf_counter() - self.published >= self.publish_interval:
+                self.publish(self.builder.build(partial=True))
+            return False
+        except Exception as e:
+            self.error_message = str(e)
+            # keep last valid compiled model
+            if self.compiled_model is not self.last_valid_model:
+                self.publish(self.last_valid_model)
+            self.loader = self.builder = None
+            return True
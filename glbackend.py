@@ -0,0 +1,114 @@
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as raw_glReadPixels
+from OpenGL.GLU import *
+import pygame
+from pygame.locals import *
+
+
+class GLBackend:
+    name = "gl"
+
+    def __init__(self):
+        pygame.init()
+        self.width = self.height = 0
+        self.pbos = None
+        self.pbo_index = self.pbo_frames = 0
+        self.pixels = None
+        self.gl_modes = {
+            "points": GL_POINTS,
+            "lines": GL_LINES,
+            "triangles": GL_TRIANGLES,
+        }
+        self.gl_types = {
+            np.dtype(np.float32): GL_FLOAT,
+            np.dtype(np.uint8): GL_UNSIGNED_BYTE,
+            np.dtype(np.int8): GL_BYTE,
+        }
+
+    def resize(self, width, height, aspect=None):
+        # aspect is the on-screen shape, sub-cell modes do not have square pixels
+        self.width, self.height = width, height
+        if self.pbos is not None:
+            glDeleteBuffers(2, self.pbos)
+            self.pbos = None
+        pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL | HIDDEN)
+        # readback target, glReadPixels writes straight into it every frame
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)
+        self.pixels_ptr = ctypes.c_void_p(self.pixels.ctypes.data)
+
+        glViewport(0, 0, width, height)
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        # rendered upside down so gl's bottom-up rows read back top-down, no flip needed
+        glScalef(1.0, -1.0, 1.0)
+        gluPerspective(45, aspect or width / height, 0.1, 50.0)
+        glMatrixMode(GL_MODELVIEW)
+        glEnable(GL_DEPTH_TEST)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+    def draw(self, mesh, modelview):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glLoadMatrixf(np.asarray(modelview, dtype=np.float32).T)
+
+        if mesh is not None:
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_COLOR_ARRAY)
+            glEnableClientState(GL_NORMAL_ARRAY)
+
+            # one draw call per primitive type, instanced batches set their arrays once
+            for batch in mesh.batches:
+                glVertexPointer(3, GL_FLOAT, 0, batch.vertices)
+                glColorPointer(3, self.gl_types[batch.colors.dtype], 0, batch.colors)
+                glNormalPointer(self.gl_types[batch.normals.dtype], 0, batch.normals)
+                if batch.matrix is None and batch.instances is None:
+                    glDrawArrays(self.gl_modes[batch.primitive], 0, len(batch))
+                    continue
+                for transform in np.ascontiguousarray(batch.transforms().transpose(0, 2, 1), dtype=np.float32):
+                    glPushMatrix()
+                    glMultMatrixf(transform)
+                    glDrawArrays(self.gl_modes[batch.primitive], 0, len(batch))
+                    glPopMatrix()
+
+            glDisableClientState(GL_NORMAL_ARRAY)
+            glDisableClientState(GL_COLOR_ARRAY)
+            glDisableClientState(GL_VERTEX_ARRAY)
+
+        pygame.display.flip()
+
+    def read_pixels(self):
+        glReadBuffer(GL_BACK)
+        raw_glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, self.pixels_ptr)
+        return self.pixels
+
+    def init_pbos(self):
+        self.pbos = glGenBuffers(2)
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.width * self.height * 3, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.pbo_index = self.pbo_frames = 0
+
+    def read_pixels_async(self, out=None):
+        # queue this frame's readback into one pbo, map the one filled last frame
+        if self.pbos is None:
+            self.init_pbos()
+
+        glReadBuffer(GL_BACK)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[self.pbo_index])
+        raw_glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        self.pbo_index ^= 1
+        self.pbo_frames += 1
+        if self.pbo_frames < 2:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            return None
+
+        if out is None:
+            out = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[self.pbo_index])
+        address = ctypes.cast(glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY), ctypes.c_void_p).value
+        ctypes.memmove(out.ctypes.data, address, out.nbytes)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return out
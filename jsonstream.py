@@ -0,0 +1,134 @@
+import json
+
+
+NUMBER_CHARS = "0123456789.eE+-"
+
+
+class StreamParser:
+    # json values pulled one at a time from an iterable of text chunks; only the
+    # unparsed tail of the input is kept, never the whole document
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.exhausted = False
+        # position of buf[0] in the whole input, for error messages
+        self.offset = 0
+        self.line = 1
+        self.line_offset = 0
+
+    def fill(self, want=1):
+        # read until at least want unparsed chars are buffered; False at the end of input
+        if self.pos:
+            dropped = self.buf[:self.pos]
+            newlines = dropped.count("\n")
+            if newlines:
+                self.line += newlines
+                self.line_offset = self.offset + dropped.rindex("\n") + 1
+            self.offset += self.pos
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        parts = [self.buf]
+        size = len(self.buf)
+        while size < want and not self.exhausted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                parts.append(chunk)
+                size += len(chunk)
+        self.buf = "".join(parts)
+        return size >= want
+
+    def fail(self, message, pos=None):
+        pos = self.offset + (self.pos if pos is None else pos)
+        before = self.buf[:pos - self.offset]
+        newlines = before.count("\n")
+        line = self.line + newlines
+        column = pos - (self.offset + before.rindex("\n") + 1 if newlines else self.line_offset) + 1
+        raise ValueError(f"{message}: line {line} column {column} (char {pos})")
+
+    def peek(self):
+        # next non-whitespace char without consuming it, "" at the end of input
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars, message):
+        char = self.peek()
+        if not char or char not in chars:
+            self.fail(message)
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.exhausted:
+                    self.fail(e.msg, e.pos)
+                end = None
+            # a number cut by a chunk boundary decodes fine, so the next char has to end it
+            if end is not None and (self.exhausted or end < len(self.buf) and self.buf[end] not in NUMBER_CHARS):
+                self.pos = end
+                return value
+            # double the lookahead so one huge value costs linear, not quadratic, work
+            self.fill(2 * (len(self.buf) - self.pos) + 1)
+
+    def items(self):
+        # elements of the array whose "[" was just consumed
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]", "Expecting ',' delimiter") == "]":
+                return
+
+    def end(self):
+        if self.peek():
+            self.fail("Extra data")
+
+
+def iter_model(chunks):
+    # ("instruction", obj) for every element of "instructions", (key, value) for other keys
+    parser = StreamParser(chunks)
+    parser.expect("{", "Expecting model object")
+    if parser.peek() == "}":
+        parser.pos += 1
+    else:
+        while True:
+            if parser.peek() != '"':
+                parser.fail("Expecting property name enclosed in double quotes")
+            key = parser.value()
+            parser.expect(":", "Expecting ':' delimiter")
+            if key == "instructions" and parser.peek() == "[":
+                parser.pos += 1
+                for instruction in parser.items():
+                    yield "instruction", instruction
+            else:
+                yield key, parser.value()
+            if parser.expect(",}", "Expecting ',' delimiter") == "}":
+                break
+    parser.end()
+
+
+def text_chunks(text, size=1 << 16):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def file_chunks(path, size=1 << 16):
+    with open(path) as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,113 @@
+import numpy as np
+
+from mesh import VERTS_PER, Batch, Mesh
+
+
+# (render scale, mesh level) from best to cheapest; mesh level n clusters on a GRIDS[n] lattice
+LEVELS = ((1.0, 0), (0.75, 0), (0.75, 1), (0.5, 1), (0.5, 2), (0.35, 3))
+GRIDS = (None, 64, 32, 16)
+
+
+def decimate_batch(batch, grid):
+    # vertex clustering: snap every vertex to the mean of its lattice cell, then
+    # drop primitives that collapsed and duplicates of ones already kept
+    k = VERTS_PER[batch.primitive]
+    vertices = np.asarray(batch.vertices, dtype=np.float32)
+    lo = vertices.min(axis=0)
+    span = max(float((vertices.max(axis=0) - lo).max()), 1e-9)
+    cell = np.minimum((vertices - lo) * (grid / span), grid - 1).astype(np.int64)
+    keys = (cell[:, 0] * grid + cell[:, 1]) * grid + cell[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    cluster = cluster.ravel()
+
+    counts = np.bincount(cluster).astype(np.float32)
+    centers = np.stack([np.bincount(cluster, vertices[:, i]) for i in range(3)], axis=1)
+    centers = (centers / counts[:, None]).astype(np.float32)
+
+    ids = cluster.reshape(-1, k)
+    keep = np.ones(len(ids), dtype=bool)
+    for a in range(k):
+        for b in range(a + 1, k):
+            keep &= ids[:, a] != ids[:, b]
+    rows = np.flatnonzero(keep)
+    _, first = np.unique(np.sort(ids[rows], axis=1), axis=0, return_index=True)
+    rows = np.sort(rows[first])
+
+    source = (rows[:, None] * k + np.arange(k)).ravel()
+    return Batch(batch.primitive, centers[cluster[source]],
+                 np.ascontiguousarray(batch.colors[source]),
+                 np.ascontiguousarray(batch.normals[source]), batch.matrix, batch.instances)
+
+
+def decimate(mesh, grid):
+    batches = []
+    for batch in mesh.batches:
+        # tiny batches gain nothing
+        batches.append(decimate_batch(batch, grid) if len(batch) > 256 else batch)
+    return Mesh(batches)
+
+
+class LodController:
+    # steps quality down while frames run over budget, back up after a stretch of headroom
+    def __init__(self, target_fps, enabled=True, down_after=8, up_after=60):
+        self.budget = 1.0 / target_fps
+        self.enabled = enabled
+        self.down_after = down_after
+        self.up_after = up_after
+        self.level = 0
+        self.average = None
+        self.over = self.under = 0
+        self.cache_model = None
+        self.cache = {}
+
+    @property
+    def scale(self):
+        return LEVELS[self.level][0]
+
+    @property
+    def mesh_level(self):
+        return LEVELS[self.level][1]
+
+    def record(self, seconds):
+        # cost of one rendered frame; True when the level changed
+        if not self.enabled:
+            return False
+        self.average = seconds if self.average is None else self.average * 0.8 + seconds * 0.2
+        if self.average > self.budget * 1.15:
+            self.over, self.under = self.over + 1, 0
+        elif self.average < self.budget * 0.55:
+            self.over, self.under = 0, self.under + 1
+        else:
+            self.over = self.under = 0
+
+        if self.over >= self.down_after and self.level < len(LEVELS) - 1:
+            return self.set_level(self.level + 1)
+        if self.under >= self.up_after and self.level > 0:
+            return self.set_level(self.level - 1)
+        return False
+
+    def settle(self):
+        # the scene stopped changing; the frame that stays up is worth full quality
+        if not self.enabled or self.level == 0:
+            return False
+        return self.set_level(0)
+
+    def set_level(self, level):
+        self.level = level
+        self.average = None
+        self.over = self.under = 0
+        return True
+
+    def mesh(self, model):
+        # decimated copies are built on first use and dropped with the model
+        if model is None or self.mesh_level == 0:
+            return model
+        if model is not self.cache_model:
+            self.cache_model, self.cache = model, {}
+        if self.mesh_level not in self.cache:
+            self.cache[self.mesh_level] = decimate(model, GRIDS[self.mesh_level])
+        return self.cache[self.mesh_level]
+
+    def label(self):
+        mesh = "full" if self.mesh_level == 0 else f"grid {GRIDS[self.mesh_level]}"
+        return f"LOD: {self.level} (res {self.scale:.0%}, mesh {mesh})"
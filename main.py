@@ -1,23 +1,59 @@
+import argparse
 import curses
-import numpy as np
 import os
+import threading
 import time
-from OpenGL.GL import *
-from OpenGL.GLU import *
-import pygame
-from pygame.locals import *
 
 from edit import TextEditor, JsonModelRenderer
+from jsonstream import file_chunks, text_chunks
+from mesh import camera_matrix, perspective_matrix
+from cull import Culler
+from cells import CELL_MODES, DEFAULT, CellGrid, Quantizer, Resampler, framebuffer_to_cells
+from lod import LodController
+from output import CursesOutput, AnsiOutput
+from pipeline import FramePipeline
+from profiler import FrameProfiler
+from raster import make_backend
+from stream import FrameStream, TeeOutput, open_sinks
+from watcher import FileWatcher
 
 
 class TerminalRenderer:
-    def __init__(self):
+    def __init__(self, output="ansi", colors="256", dither=False, backend="gl",
+                 pipelined=False, target_fps=60, profile_log=None, adaptive=True, cells="half",
+                 record=None, serve=None, tiles=1, views=1, cull=True, backfaces=False):
         self.stdscr = None
+        self.profiler = FrameProfiler(log_path=profile_log)
+        self.pipelined = pipelined
+        self.pipeline = None
+        self.terminal_lock = threading.Lock()
+        self.frame_interval = 1.0 / target_fps
+        self.lod = LodController(target_fps, enabled=adaptive)
+        # extra views orbit the model, one frustum can't stand for all of them; tile workers map
+        # the mesh once per model, a culled mesh would be shared again whenever the view moves
+        self.culler = Culler(backfaces) if cull and tiles * views == 1 else None
+        # tiles rasterize in their own workers, the gl window would never be drawn to
+        self.backend = make_backend("software" if tiles * views > 1 else backend)
+        self.output_name = output
+        self.output = None
+        self.colors = colors
+        self.dither = dither
+        self.cell_mode = cells
+        self.record, self.serve = record, serve
+        self.stream = None
+        self.tiled = None
+        if tiles * views > 1:
+            from tiles import TileRenderer
+            self.tiled = TileRenderer(tiles, views)
         self.term_height = self.term_width = 0
         self.split_ratio = 0.7
+        self.resampler = Resampler()
         
-        pygame.init()
-        self.model_renderer = JsonModelRenderer()
+        # model.json is always the one in the working directory
+        self.model_renderer = JsonModelRenderer(base_dir=os.getcwd())
+        if self.culler:
+            # the cull index is built as more slices of the load, not on the first frame
+            self.model_renderer.prepare = self.culler.prepare
         
         self.last_time = time.time()
         self.frame_count = self.fps = 0
@@ -37,6 +73,19 @@ class TerminalRenderer:
         self.mouse_sensitivity = 2.0
         self.error_message = ""
         
+        # editor revision the current model was parsed from
+        self.model_revision = -1
+        self.parse_debounce = 0.15
+        
+        # render on demand
+        self.idle = False
+        self.idle_timeout = 250
+        self.max_events = 512  # per frame, keeps a flood of input from starving the render
+        self.last_scene_state = self.last_editor_state = None
+        self.settle_frames = 0
+        self.frame_start = 0.0
+        self.last_change = 0.0
+        
     def setup_screen(self):
         self.stdscr = curses.initscr()
         curses.start_color()
@@ -51,43 +100,65 @@ class TerminalRenderer:
         
         self.term_height, self.term_width = self.stdscr.getmaxyx()
         
-        self.init_color_pairs()
-        self.update_dimensions()
+        if self.output_name == "curses":
+            # curses has no truecolor pairs
+            if self.colors == "truecolor" or curses.COLORS < 256:
+                self.colors = "256" if curses.COLORS >= 256 else "8"
+            self.output = CursesOutput(self.stdscr, self.colors)
+        else:
+            self.output = AnsiOutput(mode=self.colors)
+        self.quantizer = Quantizer(self.colors, self.dither)
         
-        pygame.display.set_mode((self.gl_width, self.gl_height), DOUBLEBUF | OPENGL | HIDDEN)
+        self.update_dimensions()
+        if self.record or self.serve:
+            self.open_stream(self.output)
         
-        glViewport(0, 0, self.gl_width, self.gl_height)
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(45, self.gl_width / self.gl_height, 0.1, 50.0)
-        glMatrixMode(GL_MODELVIEW)
-        glEnable(GL_DEPTH_TEST)
+        # curses calls are not thread safe, only the ansi writer can run off-thread
+        if self.pipelined and self.output_name == "ansi" and not self.tiled:
+            self.pipeline = FramePipeline(self.output, self.quantizer, self.terminal_lock, self.cell_mode)
         
-        self.buffer = np.zeros((self.render_height, self.render_width, 2, 3), dtype=np.uint8)
+        self.init_color_pairs()
         
-        editor_width = self.term_width - self.render_width - 1
-        if editor_width < 10:
-            editor_width = 10
-            self.render_width = self.term_width - editor_width - 1
+        self.backend.resize(self.gl_width, self.gl_height, self.render_aspect)
         
         self.editor = TextEditor(
             self.stdscr, 
             self.render_width,
-            editor_width, 
+            self.editor_width, 
             self.term_height
         )
     
+    def open_stream(self, output=None):
+        # frames are encoded once for the recording and every attached viewer
+        sinks = open_sinks(self.record, self.serve, self.render_width, self.render_height)
+        self.stream = FrameStream(self.colors, sinks)
+        self.output = self.stream if output is None else TeeOutput(output, self.stream)
+    
     def update_dimensions(self):
         render_width = int(self.term_width * self.split_ratio)
-        render_width = max(10, min(render_width, self.term_width - 10))
-        
-        self.render_width = render_width
-        self.render_height = self.term_height
+        # the editor keeps at least 10 columns next to the divider
+        render_width = max(10, min(render_width, self.term_width - 11))
+        self.editor_width = max(10, self.term_width - render_width - 1)
+        self.set_render_size(render_width, self.term_height)
+    
+    def set_render_size(self, width, height):
+        self.render_width = width
+        self.render_height = height
         
-        self.gl_width = self.render_width
-        self.gl_height = self.render_height * 2
+        # internal resolution: sub-pixels per cell, scaled down by the lod controller
+        cell_w, cell_h = CELL_MODES[self.cell_mode]
+        self.gl_width = max(1, round(self.render_width * cell_w * self.lod.scale))
+        self.gl_height = max(2, round(self.render_height * cell_h * self.lod.scale))
+        # cells are about twice as tall as wide
+        self.render_aspect = self.render_width / (self.render_height * 2)
+        self.projection = perspective_matrix(45, self.render_aspect, 0.1, 50.0)
         
-        self.buffer = np.zeros((self.render_height, self.render_width, 2, 3), dtype=np.uint8)
+        self.cells = CellGrid(self.render_height, self.render_width)
+        if self.pipeline:
+            # the worker may be encoding, it invalidates the output itself
+            self.pipeline.invalidate(self.cells)
+        elif self.output:
+            self.output.invalidate()
     
     def init_color_pairs(self):
         for bg in range(8):
@@ -96,70 +167,26 @@ class TerminalRenderer:
                 if pair_idx < 64:
                     curses.init_pair(pair_idx, fg, bg)
     
-    def get_closest_color(self, r, g, b):
-        r_bin = 1 if r > 127 else 0
-        g_bin = 1 if g > 127 else 0
-        b_bin = 1 if b > 127 else 0
-        return r_bin * 1 + g_bin * 2 + b_bin * 4
+    def fit_pixels(self, pixels):
+        cell_w, cell_h = CELL_MODES[self.cell_mode]
+        return self.resampler(pixels, self.cells.height * cell_h, self.cells.width * cell_w)
     
     def render_to_buffer(self):
-        glReadBuffer(GL_BACK)
-        pixels = glReadPixels(0, 0, self.gl_width, self.gl_height, GL_RGB, GL_UNSIGNED_BYTE)
-        pixel_array = np.frombuffer(pixels, dtype=np.uint8).reshape(self.gl_height, self.gl_width, 3)
-        pixel_array = np.flipud(pixel_array)
-        
-        height_limit = min(self.render_height, pixel_array.shape[0] // 2)
-        width_limit = min(self.render_width, pixel_array.shape[1])
-        
-        for y in range(height_limit):
-            for x in range(width_limit):
-                self.buffer[y, x, 0] = pixel_array[y*2, x]
-                self.buffer[y, x, 1] = pixel_array[y*2+1, x]
+        if self.tiled:
+            # workers already converted their tiles, only the composite is left
+            self.tiled.finish(self.cells)
+            self.profiler.mark("convert")
+            return
+        pixels = self.backend.read_pixels()
+        self.profiler.mark("readback")
+        pixels = self.fit_pixels(pixels)
+        framebuffer_to_cells(pixels, self.cells, self.quantizer, self.cell_mode)
+        self.profiler.mark("convert")
                 
     def display_error(self, error_message):
-        try:
-            self.error_message = error_message
-            if not error_message:
-                return
-                
-            error_y = self.term_height - 1
-            max_len = min(len(error_message), self.render_width)
-            
-            self.stdscr.attron(curses.color_pair(4 * 8 + 7 + 1))  # Red bg, white fg 
-            self.stdscr.addstr(error_y, 0, error_message[:max_len])
-            
-            if max_len < self.render_width:
-                self.stdscr.addstr(error_y, max_len, " " * (self.render_width - max_len))
-            
-            self.stdscr.attroff(curses.color_pair(4 * 8 + 7 + 1))
-        except curses.error:
-            pass
+        self.error_message = error_message
 
-    def display_buffer(self):
-        term_height, term_width = self.stdscr.getmaxyx()
-        if term_height != self.term_height or term_width != self.term_width:
-            self.term_height, self.term_width = term_height, term_width
-            self.update_dimensions()
-        
-        max_y = min(self.render_height - 1, term_height - 1
-        ) if self.error_message else min(self.render_height, term_height)
-        max_x = min(self.render_width, term_width - 1)
-        
-        for y in range(max_y):
-            for x in range(max_x):
-                if y < self.buffer.shape[0] and x < self.buffer.shape[1]:
-                    top_pix = self.buffer[y, x, 0]
-                    bot_pix = self.buffer[y, x, 1]
-                    
-                    top_color = self.get_closest_color(*top_pix)
-                    bot_color = self.get_closest_color(*bot_pix)
-                    
-                    pair_idx = top_color * 8 + bot_color + 1
-                    if pair_idx >= 64: pair_idx = 63
-
-                    self.stdscr.addch(y, x, '▄', curses.color_pair(pair_idx))
-
-        # draw ui
+    def hud_overlays(self):
         self.frame_count += 1
         current_time = time.time()
         if current_time - self.last_time >= 1.0:
@@ -167,39 +194,132 @@ class TerminalRenderer:
             self.frame_count = 0
             self.last_time = current_time
 
-        self.stdscr.addstr(3, 0, f"FPS: {self.fps}")
-        self.stdscr.addstr(2, 0, f"Zoom: {self.camera_distance:.1f}")
-        self.stdscr.addstr(1, 0, f"Angle: {self.camera_rotation_y:.1f}°, {self.camera_rotation_x:.1f}°")
-        self.stdscr.addstr(0, 0, "[TAB] Auto Rotate | [M] Rotate/Zoom")
+        overlays = [
+            (3, 0, f"FPS: {self.fps}", DEFAULT, DEFAULT),
+            (2, 0, f"Zoom: {self.camera_distance:.1f}", DEFAULT, DEFAULT),
+            (1, 0, f"Angle: {self.camera_rotation_y:.1f}°, {self.camera_rotation_x:.1f}°", DEFAULT, DEFAULT),
+            (0, 0, "[TAB] Auto Rotate | [M] Rotate/Zoom | [^P] Profile", DEFAULT, DEFAULT),
+        ]
+        if self.lod.enabled:
+            overlays.append((4, 0, self.lod.label(), DEFAULT, DEFAULT))
+        if self.culler and self.culler.stats:
+            overlays.append((5, 0, self.culler.label(), DEFAULT, DEFAULT))
 
-    
-    def draw_scene(self):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if self.error_message:
+            overlays.append((self.render_height - 1, 0, self.error_message.ljust(self.render_width),
+                             self.quantizer.basic_color(curses.COLOR_WHITE),
+                             self.quantizer.basic_color(curses.COLOR_BLUE)))
         
-        glLoadIdentity()
-        glTranslatef(self.camera_position_x, self.camera_position_y, -self.camera_distance)
-        glRotatef(self.camera_rotation_x, 1.0, 0.0, 0.0)
-        glRotatef(self.camera_rotation_y, 0.0, 1.0, 0.0)
+        if self.profiler.visible:
+            for i, line in enumerate(self.profiler.overlay_lines()):
+                overlays.append((6 + i, 0, line, DEFAULT, DEFAULT))
+        return overlays
+
+    def check_resize(self):
+        # ncurses turns SIGWINCH into KEY_RESIZE; everything sized from the terminal
+        # (cells, gl surface, viewport, projection, editor) is rebuilt together here
+        term_height, term_width = self.stdscr.getmaxyx()
+        if term_height != self.term_height or term_width != self.term_width:
+            self.term_height, self.term_width = term_height, term_width
+            self.update_dimensions()
+            self.backend.resize(self.gl_width, self.gl_height, self.render_aspect)
+            # curses.LINES/COLS keep the startup size unless told, the editor clamps against them
+            curses.update_lines_cols()
+            self.editor.resize(self.render_width, self.editor_width, self.term_height)
+            # the terminal keeps whatever the old layout left where nothing gets redrawn
+            with self.terminal_lock:
+                self.stdscr.clear()
+                self.stdscr.refresh()
+            return True
+        return False
+
+    def display_buffer(self):
+        for y, x, text, fg, bg in self.hud_overlays():
+            self.cells.put_text(y, x, text, fg, bg)
+
+        max_y = min(self.render_height, self.term_height)
+        max_x = min(self.render_width, self.term_width - 1)
+        self.output.draw(self.cells, max_y, max_x)
+
+    def submit_frame(self):
+        # gl hands back the previous frame's pixels, so the readback never stalls
+        frame = self.pipeline.buffer((self.gl_height, self.gl_width, 3))
+        pixels = self.backend.read_pixels_async(frame)
+        self.profiler.mark("readback")
+        if pixels is None:
+            self.pipeline.release(frame)
+            return
         
-        try:
-            json_data = '\n'.join(self.editor.content)
-            if self.auto_rotate:
-                self.rotation_angle += 1
-                self.last_rotation_angle = self.rotation_angle
-            else:
-                self.rotation_angle = self.last_rotation_angle
-                
-            render_success = self.model_renderer.render(json_data, self.rotation_angle)
-            if not render_success:
-                self.display_error(self.model_renderer.error_message)
-            else:
-                self.display_error("")
-        except Exception as e:
-            self.display_error(str(e))
+        max_y = min(self.render_height, self.term_height)
+        max_x = min(self.render_width, self.term_width - 1)
+        self.pipeline.submit(pixels, self.cells, self.hud_overlays(), max_y, max_x)
+
+    
+    def model_matrix(self):
+        return camera_matrix(self.camera_distance, self.camera_rotation_x, self.camera_rotation_y,
+                             self.camera_position_x, self.camera_position_y, self.rotation_angle)
+    
+    def update_model(self):
+        # only re-join and re-parse once typing has paused for parse_debounce
+        revision = self.editor.revision
+        if revision == self.model_revision:
+            return
+        if time.time() - self.editor.last_edit_time < self.parse_debounce:
+            return
+        self.model_revision = revision
+        self.model_renderer.start(self.editor.content.chunks())
+    
+    def step_model(self):
+        # big models load in slices of half a frame, the partial model keeps rendering meanwhile
+        if self.model_renderer.loading and self.model_renderer.step(self.frame_interval * 0.5):
+            self.display_error(self.model_renderer.error_message)
+    
+    def advance(self):
+        if self.auto_rotate:
+            self.rotation_angle += 1
+            self.last_rotation_angle = self.rotation_angle
+        else:
+            self.rotation_angle = self.last_rotation_angle
         
-        pygame.display.flip()
+        self.update_model()
+        self.step_model()
+    
+    def scene_state(self):
+        # everything that changes the rendered pane; equal state = nothing to redraw
+        return (self.camera_distance, self.camera_rotation_x, self.camera_rotation_y,
+                self.camera_position_x, self.camera_position_y, self.rotation_angle,
+                self.model_revision, self.stdscr.getmaxyx(), self.error_message,
+                self.profiler.visible, self.lod.level, self.model_renderer.generation)
+    
+    def input_timeout(self):
+        # ms getch may block for; 0 while animating
+        if not self.idle or self.model_renderer.loading:
+            return 0
+        timeout = self.idle_timeout
+        if self.editor.revision != self.model_revision:
+            pending = self.editor.last_edit_time + self.parse_debounce - time.time()
+            timeout = min(timeout, max(0, int(pending * 1000) + 1))
+        return timeout
     
-    def on_mouse_event(self, event):
+    def draw_scene(self):
+        mesh = self.lod.mesh(self.model_renderer.compiled_model)
+        modelview = self.model_matrix()
+        if self.culler:
+            # partial models change every publish, the index is only worth building for the final one
+            if self.model_renderer.loading:
+                self.culler.stats = None
+            else:
+                mesh = self.culler.cull(mesh, self.projection, modelview)
+        if self.tiled:
+            self.tiled.draw(mesh, modelview, self.cells, self.quantizer, self.cell_mode, self.lod.scale)
+        else:
+            self.backend.draw(mesh, modelview)
+    
+    def apply_lod(self):
+        self.update_dimensions()
+        self.backend.resize(self.gl_width, self.gl_height, self.render_aspect)
+    
+    def on_mouse_event(self, event, count=1):
         _, x, y, _, button_state = event
         
         if x >= self.render_width:
@@ -242,10 +362,10 @@ class TerminalRenderer:
         
         # zoom
         elif button_state & curses.BUTTON4_PRESSED:
-            self.camera_distance = max(1.0, self.camera_distance - 0.3)
+            self.camera_distance = max(1.0, self.camera_distance - 0.3 * count)
             return True
         elif button_state & curses.BUTTON5_PRESSED:
-            self.camera_distance += 0.3
+            self.camera_distance += 0.3 * count
             return True
         
         # motion
@@ -264,17 +384,107 @@ class TerminalRenderer:
         
         return True
     
-    def on_key_event(self):
+    def read_events(self):
+        # everything already queued; only the first getch may block
+        self.stdscr.timeout(self.input_timeout())
+        events = []
         key = self.stdscr.getch()
-        # 9 = tab | 19 = ctrl+s
-        if key == 9:    self.auto_rotate = not self.auto_rotate
-        elif key == 19: self.editor.save_file()
-        elif key == curses.KEY_MOUSE:
-            mouse_event = curses.getmouse()
-            if not self.on_mouse_event(mouse_event):
-                self.editor.handle_key(key)
-
-        elif key != -1: self.editor.handle_key(key)
+        # the frame starts once that wait is over, idle time is not charged to it
+        self.frame_start = time.perf_counter()
+        self.profiler.begin_frame()
+        while key != -1:
+            if key == curses.KEY_MOUSE:
+                try:
+                    events.append((key, curses.getmouse()))
+                except curses.error:
+                    pass
+            else:
+                events.append((key, None))
+            if len(events) >= self.max_events:
+                break
+            self.stdscr.timeout(0)
+            key = self.stdscr.getch()
+        return events
+    
+    def coalesce_events(self, events):
+        # a run of mouse reports with the same button state telescopes: drags only
+        # need the first and last position, wheel steps just add up
+        merged = []
+        for key, mouse in events:
+            if mouse is not None and merged and merged[-1][1] is not None:
+                _, last, count, first = merged[-1]
+                if last[4] == mouse[4]:
+                    merged[-1] = (key, mouse, count + 1, first)
+                    continue
+            merged.append((key, mouse, 1, mouse))
+        
+        coalesced = []
+        for key, mouse, count, first in merged:
+            wheel = mouse is not None and mouse[4] & (curses.BUTTON4_PRESSED | curses.BUTTON5_PRESSED)
+            if wheel:
+                coalesced.append((key, mouse, count))
+                continue
+            if count > 1:
+                coalesced.append((key, first, 1))
+            coalesced.append((key, mouse, 1))
+        return coalesced
+    
+    def on_key_event(self):
+        for key, mouse, count in self.coalesce_events(self.read_events()):
+            # 9 = tab | 19 = ctrl+s | 16 = ctrl+p
+            if key == 9:    self.auto_rotate = not self.auto_rotate
+            elif key == 19: self.editor.save_file()
+            elif key == 16: self.profiler.toggle()
+            elif key == curses.KEY_RESIZE: self.check_resize()
+            elif key == curses.KEY_MOUSE:
+                if not self.on_mouse_event(mouse, count):
+                    self.editor.handle_key(key)
+            else: self.editor.handle_key(key)
+    
+    def load_model(self, chunks):
+        self.model_renderer.start(chunks)
+        self.model_revision += 1
+    
+    def run_headless(self, width, height, duration=None):
+        # no curses and no editor: model.json goes straight to the recording/viewers
+        self.quantizer = Quantizer(self.colors, self.dither)
+        self.term_width, self.term_height = width, height
+        self.set_render_size(width, height)
+        self.open_stream()
+        self.backend.resize(self.gl_width, self.gl_height, self.render_aspect)
+        
+        self.load_model(file_chunks("model.json"))
+        watcher = FileWatcher("model.json", loader=str)
+        
+        end = None if duration is None else time.perf_counter() + duration
+        try:
+            while end is None or time.perf_counter() < end:
+                frame_start = time.perf_counter()
+                text = watcher.take()
+                if text is not None:
+                    self.load_model(text_chunks(text))
+                self.step_model()
+                if self.auto_rotate:
+                    self.rotation_angle += 1
+                
+                self.draw_scene()
+                self.render_to_buffer()
+                if self.error_message:
+                    self.cells.put_text(self.render_height - 1, 0, self.error_message.ljust(self.render_width),
+                                        self.quantizer.basic_color(curses.COLOR_WHITE),
+                                        self.quantizer.basic_color(curses.COLOR_BLUE))
+                self.output.draw(self.cells, self.render_height, self.render_width)
+                
+                elapsed = time.perf_counter() - frame_start
+                if elapsed < self.frame_interval:
+                    time.sleep(self.frame_interval - elapsed)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.stop()
+            self.stream.close()
+            if self.tiled:
+                self.tiled.close()
     
     def render(self):
         self.setup_screen()
@@ -282,15 +492,114 @@ class TerminalRenderer:
         while True:
             self.on_key_event()
             self.editor.check_file_changed()
-                
-            self.draw_scene()
-            self.render_to_buffer()
-            self.display_buffer()
-            self.editor.draw()
-                
-            self.stdscr.refresh()
-            time.sleep(0.016) 
+            self.profiler.mark("input")
+            self.advance()
+            self.profiler.mark("model")
+            # model loading has its own slice of the budget, lod only answers for rendering
+            work_start = time.perf_counter()
+            
+            state = self.scene_state()
+            dirty = state != self.last_scene_state
+            if dirty:
+                self.last_scene_state = state
+                self.last_change = time.perf_counter()
+                # pipelined gl readback lags a frame, draw once more to flush it
+                self.settle_frames = 1 if self.pipeline else 0
+            elif self.settle_frames:
+                self.settle_frames -= 1
+                dirty = True
+            elif self.stream and self.stream.waiting():
+                # a viewer attached to a still scene, it needs a frame to start from
+                dirty = True
+            
+            if dirty:
+                self.draw_scene()
+                self.profiler.mark("draw")
+                if self.pipeline:
+                    self.submit_frame()
+                else:
+                    self.render_to_buffer()
+                    self.display_buffer()
+                self.profiler.mark("output")
+            
+            editor_state = (self.editor.view_state(), state[7])
+            editor_dirty = editor_state != self.last_editor_state
+            if editor_dirty:
+                self.last_editor_state = editor_state
+                self.editor.draw()
+                self.profiler.mark("editor")
+            
+            if dirty or editor_dirty:
+                with self.terminal_lock:
+                    self.stdscr.refresh()
+                    if not self.pipeline:
+                        self.output.flush()
+                self.profiler.mark("write")
+            self.profiler.end_frame(dirty)
+            
+            # quality follows measured cost, blocking on input is not counted
+            if dirty and self.lod.record(time.perf_counter() - work_start):
+                self.apply_lod()
+            
+            # when idle the next getch blocks instead
+            self.idle = not dirty
+            # gaps between events of a drag are not stillness, wait out a whole idle timeout
+            still = time.perf_counter() - self.last_change >= self.idle_timeout / 1000
+            if self.idle and still and self.lod.settle():
+                # a slowdown would otherwise leave the still image at low quality for good
+                self.apply_lod()
+                self.idle = False
+            if dirty:
+                # sleep off whatever is left of the frame budget
+                elapsed = time.perf_counter() - self.frame_start
+                if elapsed < self.frame_interval:
+                    time.sleep(self.frame_interval - elapsed)
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", choices=["ansi", "curses"], default="ansi",
+                        help="ansi = diffed escape-sequence writer, curses = addstr per color run")
+    parser.add_argument("--colors", choices=Quantizer.MODES, default="256")
+    parser.add_argument("--dither", action="store_true", help="ordered 4x4 dither before quantizing")
+    parser.add_argument("--cells", choices=list(CELL_MODES), default="half",
+                        help="pixels per cell: half = 1x2 blocks, quadrant = 2x2, braille = 2x4")
+    parser.add_argument("--backend", choices=["gl", "software"], default="gl",
+                        help="software = NumPy rasterizer, no window or GL context needed")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="async readback, convert and write frames on a worker thread (ansi output only)")
+    parser.add_argument("--fps", type=float, default=60, help="target frame rate")
+    parser.add_argument("--fixed-quality", action="store_true",
+                        help="always render full resolution and the full mesh")
+    parser.add_argument("--tiles", type=int, default=1,
+                        help="rasterize in this many strips on a process pool (software rasterizer)")
+    parser.add_argument("--views", type=int, default=1,
+                        help="side by side viewports orbiting the model, rendered on the tile pool")
+    parser.add_argument("--no-cull", action="store_true",
+                        help="submit the whole model every frame instead of what is in view")
+    parser.add_argument("--backface-cull", action="store_true",
+                        help="also skip clusters of triangles facing away (needs consistent winding)")
+    parser.add_argument("--record", metavar="PATH", help="also write the rendered pane to an asciicast file")
+    parser.add_argument("--serve", metavar="ADDR",
+                        help="broadcast frames to viewers on unix:/path.sock or [host]:port")
+    parser.add_argument("--headless", action="store_true",
+                        help="no terminal ui, render model.json for --record/--serve only")
+    parser.add_argument("--size", default="100x40", help="headless render size, WxH cells")
+    parser.add_argument("--duration", type=float, help="headless: stop after this many seconds")
+    parser.add_argument("--profile-log", metavar="PATH",
+                        help="write per-stage frame timings, .csv or json lines")
+    args = parser.parse_args()
 
-renderer = TerminalRenderer()
-renderer.render()
\ No newline at end of file
+    renderer = TerminalRenderer(output=args.output, colors=args.colors, dither=args.dither,
+                                backend=args.backend, pipelined=args.pipeline, target_fps=args.fps,
+                                profile_log=args.profile_log, adaptive=not args.fixed_quality,
+                                cells=args.cells, record=args.record, serve=args.serve,
+                                tiles=args.tiles, views=args.views, cull=not args.no_cull,
+                                backfaces=args.backface_cull)
+    if args.headless:
+        if not (args.record or args.serve):
+            parser.error("--headless needs --record and/or --serve")
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        renderer.run_headless(width, height, args.duration)
+    else:
+        renderer.render()
\ No newline at end of file
@@ -0,0 +1,424 @@
+import math
+import os
+import numpy as np
+
+
+# begin mode -> (primitive it is drawn as, vertex index pattern)
+PRIMITIVE_MODES = {
+    "GL_POINTS": "points",
+    "GL_LINES": "lines",
+    "GL_LINE_STRIP": "lines",
+    "GL_LINE_LOOP": "lines",
+    "GL_TRIANGLES": "triangles",
+    "GL_TRIANGLE_STRIP": "triangles",
+    "GL_TRIANGLE_FAN": "triangles",
+    "GL_QUADS": "triangles",
+    "GL_QUAD_STRIP": "triangles",
+    "GL_POLYGON": "triangles",
+}
+PRIMITIVES = ("points", "lines", "triangles")
+# extra instruction keys passed through to instance/repeat
+INSTANCE_OPTIONS = ("translate", "rotate", "scale", "color", "colors")
+
+
+def translate_matrix(x, y, z):
+    m = np.identity(4)
+    m[:3, 3] = x, y, z
+    return m
+
+
+def scale_matrix(x, y, z):
+    return np.diag([x, y, z, 1.0])
+
+
+def rotate_matrix(angle, x, y, z):
+    # same as glRotatef
+    axis = np.array([x, y, z], dtype=np.float64)
+    length = np.linalg.norm(axis)
+    if length == 0:
+        return np.identity(4)
+    x, y, z = axis / length
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    t = 1 - c
+    m = np.identity(4)
+    m[:3, :3] = [[x * x * t + c, x * y * t - z * s, x * z * t + y * s],
+                 [y * x * t + z * s, y * y * t + c, y * z * t - x * s],
+                 [z * x * t - y * s, z * y * t + x * s, z * z * t + c]]
+    return m
+
+
+def instance_matrix(translate=None, rotate=None, scale=None):
+    # T * R * S, any part may be left out
+    m = np.identity(4)
+    if translate:
+        m = m @ translate_matrix(*translate)
+    if rotate:
+        m = m @ rotate_matrix(*rotate)
+    if scale:
+        m = m @ scale_matrix(*scale)
+    return m
+
+
+def tint_colors(colors, tint):
+    if tuple(tint) == (1.0, 1.0, 1.0):
+        return colors
+    tinted = np.asarray(colors, dtype=np.float32) * np.asarray(tint, dtype=np.float32)
+    if colors.dtype == np.uint8:
+        return np.clip(tinted + 0.5, 0, 255).astype(np.uint8)
+    return tinted
+
+
+def perspective_matrix(fovy, aspect, near, far):
+    # same as gluPerspective
+    f = 1.0 / math.tan(math.radians(fovy) / 2)
+    m = np.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2 * far * near / (near - far)
+    m[3, 2] = -1
+    return m
+
+
+def primitive_indices(mode, n):
+    # indices into the vertices of one begin/end block, as points/lines/triangles
+    if mode == "GL_POINTS":
+        return np.arange(n)
+    if mode == "GL_LINES":
+        return np.arange(n - n % 2)
+    if mode in ("GL_LINE_STRIP", "GL_LINE_LOOP"):
+        if n < 2:
+            return np.arange(0)
+        i = np.arange(n - 1)
+        pairs = np.stack([i, i + 1], 1)
+        if mode == "GL_LINE_LOOP" and n > 2:
+            pairs = np.vstack([pairs, [[n - 1, 0]]])
+        return pairs.ravel()
+    if mode == "GL_TRIANGLE_STRIP":
+        i = np.arange(max(n - 2, 0))
+        odd = i % 2 == 1
+        return np.stack([np.where(odd, i + 1, i), np.where(odd, i, i + 1), i + 2], 1).ravel()
+    if mode in ("GL_TRIANGLE_FAN", "GL_POLYGON"):
+        i = np.arange(1, max(n - 1, 1))
+        return np.stack([np.zeros_like(i), i, i + 1], 1).ravel()
+    if mode == "GL_QUADS":
+        q = np.arange(n // 4) * 4
+        return np.stack([q, q + 1, q + 2, q, q + 2, q + 3], 1).ravel()
+    if mode == "GL_QUAD_STRIP":
+        q = np.arange(max(n // 2 - 1, 0)) * 2
+        return np.stack([q, q + 1, q + 3, q, q + 3, q + 2], 1).ravel()
+    return np.arange(n - n % 3)
+
+
+class Batch:
+    # colors are float [0, 1] or uint8, matrix (model transform) is None for baked vertices;
+    # instances is a (k, 4, 4) stack, the arrays are then drawn k times as matrix @ instances[i]
+    def __init__(self, primitive, vertices, colors, normals, matrix=None, instances=None):
+        self.primitive = primitive
+        self.vertices = vertices
+        self.colors = colors
+        self.normals = normals
+        self.matrix = matrix
+        self.instances = instances
+
+    def __len__(self):
+        return len(self.vertices)
+
+    @property
+    def instance_count(self):
+        return 1 if self.instances is None else len(self.instances)
+
+    def transforms(self):
+        # (k, 4, 4) model transforms of every copy drawn
+        base = np.identity(4) if self.matrix is None else np.asarray(self.matrix)
+        if self.instances is None:
+            return base[None]
+        return base @ self.instances
+
+
+class Mesh:
+    def __init__(self, batches=()):
+        self.batches = [b for b in batches if len(b)]
+
+    @property
+    def vertex_count(self):
+        # vertices drawn per frame, instanced copies included
+        return sum(len(b) * b.instance_count for b in self.batches)
+
+
+VERTS_PER = {"points": 1, "lines": 2, "triangles": 3}
+# primitives per culling cluster, final builds keep every such run spatially compact
+CLUSTER = 2048
+
+
+def spatial_order(vertices, k, size=CLUSTER):
+    # primitive order from median splits on the longest axis, cut at multiples of size
+    # so each run of size primitives covers a small box; a generator that yields between
+    # splits and returns the order, see finish()
+    centers = vertices.reshape(-1, k, 3).mean(axis=1)
+    order = np.arange(len(centers))
+    stack = [(0, len(order))]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start <= size:
+            continue
+        part = order[start:stop]
+        points = centers[part]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        half = ((stop - start) // 2 + size - 1) // size * size
+        order[start:stop] = part[np.argpartition(points[:, axis], half)]
+        stack.append((start, start + half))
+        stack.append((start + half, stop))
+        yield
+    return order
+
+
+def finish(steps):
+    # run a sliced generator to the end in one go, its return value
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+
+def pack_parts(primitive, parts):
+    # emitted (n, 9) position/color/normal rows -> one batch
+    data = np.concatenate(parts)
+    return Batch(primitive,
+                 np.ascontiguousarray(data[:, :3]),
+                 np.ascontiguousarray(data[:, 3:6]),
+                 np.ascontiguousarray(data[:, 6:9]))
+
+
+def spatial_batch(batch):
+    # generator, one step per split and per array; returns the spatially ordered batch
+    k = VERTS_PER[batch.primitive]
+    order = yield from spatial_order(batch.vertices, k)
+    index = (order[:, None] * k + np.arange(k)).ravel()
+    fields = []
+    for name in ("vertices", "colors", "normals"):
+        fields.append(getattr(batch, name)[index])
+        yield
+    return Batch(batch.primitive, *fields)
+
+
+# begin/end modes whose primitives never share vertices, so long blocks can be emitted as they grow
+INDEPENDENT_MODES = ("GL_POINTS", "GL_LINES", "GL_TRIANGLES", "GL_QUADS")
+
+
+class MeshBuilder:
+    # emitted vertices are sealed into fixed batches of SEAL, so build() stays cheap mid-load
+    SEAL = 1 << 16
+    FLUSH = 6144
+
+    def __init__(self, definitions=None, library=None, resolving=None, base_dir=None):
+        self.matrix = np.identity(4)
+        self.color = (1.0, 1.0, 1.0)
+        self.normal = (0.0, 0.0, 1.0)
+        self.mode = None
+        self.block = None
+        self.parts = {p: [] for p in PRIMITIVES}
+        self.pending = {p: 0 for p in PRIMITIVES}
+        self.sealed = []
+        # indices into sealed still in emit order
+        self.unordered = []
+        self.external = []
+        
+        # named meshes are compiled once, on first build; instances only collect matrices per (name, tint)
+        self.definitions = definitions or {}
+        self.library = {} if library is None else library
+        self.resolving = set() if resolving is None else resolving
+        self.instanced = {}
+        # relative mesh_file paths are taken from the model file's directory, None = working directory
+        self.base_dir = base_dir
+
+        self.commands = {
+            "rotate3f": lambda *a: self.transform(rotate_matrix(*a)),
+            "translate3f": lambda *a: self.transform(translate_matrix(*a)),
+            "scale3f": lambda *a: self.transform(scale_matrix(*a)),
+            "begin": self.begin,
+            "end": self.end,
+            "vertex3f": self.vertex,
+            "color3f": self.set_color,
+            "normal3f": self.set_normal,
+            "mesh_file": self.mesh_file,
+            "instance": self.instance,
+            "repeat": self.repeat,
+        }
+
+    def add(self, instruction):
+        command = instruction.get("command")
+        if command in ("instance", "repeat"):
+            options = {k: instruction[k] for k in INSTANCE_OPTIONS if k in instruction}
+            self.commands[command](*instruction.get("args", []), **options)
+        elif command in self.commands:
+            self.commands[command](*instruction.get("args", []))
+
+    def feed(self, key, value):
+        # one (key, value) item from jsonstream.iter_model
+        if key == "instruction":
+            self.add(value)
+        elif key == "meshes":
+            self.define(value)
+
+    def transform(self, m):
+        # like GL, matrix changes between begin/end are ignored
+        if self.block is None:
+            self.matrix = self.matrix @ m
+
+    def begin(self, mode_str="GL_TRIANGLES"):
+        self.mode = mode_str if mode_str in PRIMITIVE_MODES else "GL_TRIANGLES"
+        self.block = []
+
+    def end(self):
+        if self.block:
+            self.emit(self.mode, self.block)
+        self.block = None
+
+    def vertex(self, x, y, z):
+        if self.block is not None:
+            self.block.append((x, y, z) + self.color + self.normal)
+            if len(self.block) >= self.FLUSH and self.mode in INDEPENDENT_MODES:
+                self.emit(self.mode, self.block)
+                self.block = []
+
+    def set_color(self, r, g, b):
+        self.color = (float(r), float(g), float(b))
+
+    def set_normal(self, x, y, z):
+        self.normal = (float(x), float(y), float(z))
+
+    def mesh_file(self, path):
+        # packed mesh drawn under the current transform, see meshfile.py
+        from meshfile import load_mesh
+        if self.block is not None:
+            return
+        if self.base_dir is not None:
+            path = os.path.join(self.base_dir, path)
+        for batch in load_mesh(path).batches:
+            matrix = self.matrix if batch.matrix is None else self.matrix @ batch.matrix
+            self.external.append(Batch(batch.primitive, batch.vertices, batch.colors,
+                                       batch.normals, matrix.copy(), batch.instances))
+
+    def define(self, definitions):
+        # a later "meshes" replaces the earlier one, like a repeated json key
+        self.definitions = definitions
+        self.library.clear()
+
+    def definition(self, name):
+        if name not in self.library:
+            if name not in self.definitions:
+                raise ValueError(f"unknown mesh '{name}'")
+            if name in self.resolving:
+                raise ValueError(f"mesh '{name}' instances itself")
+            self.resolving.add(name)
+            try:
+                source = self.definitions[name]
+                if isinstance(source, dict):
+                    source = source.get("instructions", [])
+                builder = MeshBuilder(self.definitions, self.library, self.resolving, self.base_dir)
+                for instruction in source:
+                    builder.add(instruction)
+                self.library[name] = builder.build()
+            finally:
+                # a definition that failed is not still being resolved on the next try
+                self.resolving.discard(name)
+        return self.library[name]
+
+    def add_instance(self, name, matrix, color):
+        tint = (1.0, 1.0, 1.0) if color is None else tuple(float(c) for c in color)
+        self.instanced.setdefault((name, tint), []).append(matrix)
+
+    def instance(self, name, translate=None, rotate=None, scale=None, color=None, colors=None):
+        # one copy of a named mesh under the current transform; colors is taken as its first color
+        if color is None and colors:
+            color = colors[0]
+        if self.block is None:
+            self.add_instance(name, self.matrix @ instance_matrix(translate, rotate, scale), color)
+
+    def repeat(self, name, count, translate=None, rotate=None, scale=None, colors=None, color=None):
+        # count copies, each one step further along translate/rotate/scale; colors cycle,
+        # a single color tints them all
+        if colors is None and color is not None:
+            colors = [color]
+        if self.block is not None:
+            return
+        step = instance_matrix(translate, rotate, scale)
+        m = self.matrix
+        for i in range(int(count)):
+            self.add_instance(name, m, colors[i % len(colors)] if colors else None)
+            m = m @ step
+
+    def emit(self, mode, block):
+        data = np.array(block, dtype=np.float32)
+        idx = primitive_indices(mode, len(data))
+        if not len(idx):
+            return
+        data = data[idx]
+
+        m = self.matrix
+        data[:, :3] = data[:, :3] @ m[:3, :3].T + m[:3, 3]
+        normals = data[:, 6:9] @ np.linalg.inv(m[:3, :3])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        data[:, 6:9] = normals / np.where(lengths == 0, 1, lengths)
+        primitive = PRIMITIVE_MODES[mode]
+        self.parts[primitive].append(data)
+        self.pending[primitive] += len(data)
+        if self.pending[primitive] >= self.SEAL:
+            self.seal(primitive)
+
+    def seal(self, primitive):
+        self.sealed.append(pack_parts(primitive, self.parts[primitive]))
+        self.unordered.append(len(self.sealed) - 1)
+        self.parts[primitive] = []
+        self.pending[primitive] = 0
+
+    def close(self):
+        # no more instructions: whatever is pending gets sealed too
+        for primitive in PRIMITIVES:
+            if self.parts[primitive]:
+                self.seal(primitive)
+
+    def order(self):
+        # spatially order sealed batches; a generator, so a loader can run it in slices
+        # between instructions, build() finishes whatever is left in one go
+        while self.unordered:
+            i = self.unordered[0]
+            self.sealed[i] = yield from spatial_batch(self.sealed[i])
+            self.unordered.pop(0)
+
+    def build(self, partial=False):
+        # partial: a snapshot while instructions are still coming, meshes not defined yet are
+        # left out and nothing is ordered
+        if not partial:
+            self.close()
+            finish(self.order())
+        batches = list(self.sealed)
+        for primitive in PRIMITIVES:
+            if self.parts[primitive]:
+                batches.append(pack_parts(primitive, self.parts[primitive]))
+        for (name, tint), matrices in self.instanced.items():
+            if partial and name not in self.definitions:
+                continue
+            stack = np.array(matrices)
+            for batch in self.definition(name).batches:
+                instances = (stack[:, None] @ batch.transforms()[None]).reshape(-1, 4, 4)
+                batches.append(Batch(batch.primitive, batch.vertices, tint_colors(batch.colors, tint),
+                                     batch.normals, instances=instances))
+        return Mesh(batches + self.external)
+
+
+def camera_matrix(distance=5.0, rotation_x=0.0, rotation_y=0.0, position_x=0.0, position_y=0.0, angle=0.0):
+    # orbit camera: pan, pull back, tilt and turn, then the model's own spin about y
+    m = translate_matrix(position_x, position_y, -distance)
+    m = m @ rotate_matrix(rotation_x, 1.0, 0.0, 0.0)
+    m = m @ rotate_matrix(rotation_y, 0.0, 1.0, 0.0)
+    return m @ rotate_matrix(angle, 0.0, 1.0, 0.0)
+
+
+def compile_instructions(instructions, definitions=None):
+    builder = MeshBuilder(definitions)
+    for instruction in instructions:
+        builder.add(instruction)
+    return builder.build()
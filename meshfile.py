@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import struct
+import numpy as np
+
+from jsonstream import file_chunks, iter_model
+from mesh import Batch, Mesh, MeshBuilder
+
+
+# file layout: magic, version, header length, json header, then 64-byte aligned arrays
+MAGIC = b"TMSH"
+VERSION = 1
+ALIGN = 64
+PRELUDE = struct.Struct("<4sII")
+
+_cache = {}
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def pack_batch(batch):
+    # compact on-disk types: float32 positions, uint8 colors, int8 normals
+    colors = batch.colors
+    if colors.dtype != np.uint8:
+        colors = np.clip(colors * 255 + 0.5, 0, 255).astype(np.uint8)
+    normals = batch.normals
+    if normals.dtype != np.int8:
+        normals = np.clip(np.round(normals * 127), -127, 127).astype(np.int8)
+    packed = {
+        "vertices": np.ascontiguousarray(batch.vertices, dtype=np.float32),
+        "colors": np.ascontiguousarray(colors),
+        "normals": np.ascontiguousarray(normals),
+    }
+    if batch.instances is not None:
+        packed["instances"] = np.ascontiguousarray(batch.instances, dtype=np.float32)
+    return packed
+
+
+def save_mesh(mesh, path):
+    entries, arrays = [], []
+    for batch in mesh.batches:
+        packed = pack_batch(batch)
+        entry = {"primitive": batch.primitive, "count": len(batch)}
+        if batch.matrix is not None:
+            entry["matrix"] = np.asarray(batch.matrix).tolist()
+        if batch.instances is not None:
+            entry["instance_count"] = len(batch.instances)
+        entries.append(entry)
+        arrays.append(packed)
+
+    # offsets depend on the header size, lay out until it stops changing
+    header = {"batches": entries}
+    header_bytes = b""
+    while True:
+        offset = _aligned(PRELUDE.size + len(header_bytes))
+        for entry, packed in zip(entries, arrays):
+            for name in packed:
+                entry[name] = offset
+                offset = _aligned(offset + packed[name].nbytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) == len(header_bytes):
+            header_bytes = encoded
+            break
+        header_bytes = encoded
+
+    with open(path, "wb") as f:
+        f.write(PRELUDE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for entry, packed in zip(entries, arrays):
+            for name in packed:
+                f.seek(entry[name])
+                f.write(packed[name].tobytes())
+
+
+def load_mesh(path):
+    # batches are read-only views into a memory map, nothing is parsed per vertex
+    stat = os.stat(path)
+    path_key = os.path.abspath(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if path_key in _cache and _cache[path_key][0] == key:
+        return _cache[path_key][1]
+
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, version, header_len = PRELUDE.unpack(data[:PRELUDE.size].tobytes())
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a mesh file")
+    if version != VERSION:
+        raise ValueError(f"{path}: unsupported mesh file version {version}")
+    header = json.loads(data[PRELUDE.size:PRELUDE.size + header_len].tobytes())
+
+    batches = []
+    for entry in header["batches"]:
+        n = entry["count"]
+        vertices = np.frombuffer(data, np.float32, n * 3, entry["vertices"]).reshape(n, 3)
+        colors = np.frombuffer(data, np.uint8, n * 3, entry["colors"]).reshape(n, 3)
+        normals = np.frombuffer(data, np.int8, n * 3, entry["normals"]).reshape(n, 3)
+        matrix = np.array(entry["matrix"]) if "matrix" in entry else None
+        instances = None
+        if "instances" in entry:
+            k = entry["instance_count"]
+            instances = np.frombuffer(data, np.float32, k * 16, entry["instances"]).reshape(k, 4, 4)
+        batches.append(Batch(entry["primitive"], vertices, colors, normals, matrix, instances))
+
+    mesh = Mesh(batches)
+    _cache[path_key] = (key, mesh)
+    return mesh
+
+
+def mesh_to_instructions(mesh):
+    modes = {"points": "GL_POINTS", "lines": "GL_LINES", "triangles": "GL_TRIANGLES"}
+    instructions = []
+    for batch in mesh.batches:
+        colors = np.asarray(batch.colors)
+        if colors.dtype == np.uint8:
+            colors = colors / 255.0
+        colors = np.round(colors, 4).tolist()
+        normals = None
+        if batch.normals is not None:
+            normals = np.asarray(batch.normals, dtype=np.float64)
+            if batch.normals.dtype == np.int8:
+                normals = normals / 127.0
+
+        # instanced copies come out as plain geometry, normals turned the way MeshBuilder.emit turns them
+        for m in batch.transforms():
+            vertices = np.asarray(batch.vertices, dtype=np.float64) @ m[:3, :3].T + m[:3, 3]
+            rows = [None] * len(vertices)
+            if normals is not None:
+                turned = normals @ np.linalg.inv(m[:3, :3])
+                lengths = np.linalg.norm(turned, axis=1, keepdims=True)
+                rows = np.round(turned / np.where(lengths == 0, 1, lengths), 4).tolist()
+            instructions.append({"command": "begin", "args": [modes[batch.primitive]]})
+            last_color = last_normal = None
+            for vertex, color, normal in zip(vertices.tolist(), colors, rows):
+                if color != last_color:
+                    instructions.append({"command": "color3f", "args": color})
+                    last_color = color
+                if normal is not None and normal != last_normal:
+                    instructions.append({"command": "normal3f", "args": normal})
+                    last_normal = normal
+                instructions.append({"command": "vertex3f", "args": vertex})
+            instructions.append({"command": "end"})
+    return instructions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert between model.json instructions and packed mesh files")
+    sub = parser.add_subparsers(dest="action", required=True)
+    pack = sub.add_parser("pack", help="instruction json -> mesh file")
+    pack.add_argument("source")
+    pack.add_argument("target")
+    unpack = sub.add_parser("unpack", help="mesh file -> instruction json")
+    unpack.add_argument("source")
+    unpack.add_argument("target")
+    args = parser.parse_args()
+
+    if args.action == "pack":
+        # streamed, a big model never exists as one json object tree
+        builder = MeshBuilder(base_dir=os.path.dirname(os.path.abspath(args.source)))
+        for key, value in iter_model(file_chunks(args.source)):
+            builder.feed(key, value)
+        save_mesh(builder.build(), args.target)
+    else:
+        with open(args.target, "w") as f:
+            json.dump({"instructions": mesh_to_instructions(load_mesh(args.source))}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import curses
+import os
+import sys
+import numpy as np
+
+from cells import PairAllocator, pair_indices, row_runs
+
+
+class CursesOutput:
+    def __init__(self, stdscr, mode="8"):
+        self.stdscr = stdscr
+        self.allocator = PairAllocator() if mode == "256" else None
+
+    def invalidate(self):
+        pass
+
+    def draw(self, grid, max_y, max_x):
+        pairs = self.allocator(grid) if self.allocator else pair_indices(grid)
+
+        # one addstr per run of equal colors instead of one addch per cell
+        for y in range(max_y):
+            line = grid.row_text(y, 0, max_x)
+            for start, stop, pair_idx in row_runs(pairs[y, :max_x]):
+                try:
+                    self.stdscr.addstr(y, start, line[start:stop], curses.color_pair(pair_idx))
+                except curses.error:
+                    pass
+
+    def flush(self):
+        pass
+
+
+class AnsiOutput:
+    # rewriting a short unchanged gap is cheaper than a cursor move
+    GAP = 6
+
+    def __init__(self, fd=None, mode="8"):
+        self.fd = fd
+        self.mode = mode
+        self.prev = None
+        self.pending = b""
+        self.bytes_written = 0
+
+    def invalidate(self):
+        self.prev = None
+
+    def sgr(self, fg, bg):
+        return "\033[%s;%sm" % (self.color_code(fg, 30), self.color_code(bg, 40))
+
+    def color_code(self, color, base):
+        if color < 0:
+            return str(base + 9)
+        if self.mode == "8":
+            return str(base + color)
+        if self.mode == "256":
+            return "%d;5;%d" % (base + 8, color)
+        return "%d;2;%d;%d;%d" % (base + 8, color >> 16, color >> 8 & 255, color & 255)
+
+    def changed_spans(self, changed):
+        # [(start, stop)] covering changed cells, merging gaps up to GAP
+        idx = np.flatnonzero(changed)
+        if not len(idx):
+            return []
+        breaks = np.flatnonzero(np.diff(idx) > self.GAP + 1)
+        starts = np.concatenate(([idx[0]], idx[breaks + 1]))
+        stops = np.concatenate((idx[breaks], [idx[-1]])) + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    def encode(self, grid, max_y, max_x, keyframe=False):
+        # keyframe = the whole frame, without touching the diff state
+        ch = grid.ch[:max_y, :max_x]
+        fg = grid.fg[:max_y, :max_x]
+        bg = grid.bg[:max_y, :max_x]
+
+        if keyframe or self.prev is None or self.prev[0].shape != ch.shape:
+            changed = np.ones(ch.shape, dtype=bool)
+        else:
+            prev_ch, prev_fg, prev_bg = self.prev
+            changed = (ch != prev_ch) | (fg != prev_fg) | (bg != prev_bg)
+        if not keyframe:
+            if self.prev is None or self.prev[0].shape != ch.shape:
+                self.prev = (ch.copy(), fg.copy(), bg.copy())
+            else:
+                for last, current in zip(self.prev, (ch, fg, bg)):
+                    np.copyto(last, current)
+
+        rows = np.flatnonzero(changed.any(axis=1))
+        if not len(rows):
+            return ""
+
+        colors = (fg.astype(np.int64) << 32) | (bg.astype(np.int64) & 0xffffffff)
+        out = ["\0337"]
+        state = None
+        for y in rows.tolist():
+            line = grid.row_text(y, 0, max_x)
+            cursor = None
+            for start, stop in self.changed_spans(changed[y]):
+                if cursor is None:
+                    out.append("\033[%d;%dH" % (y + 1, start + 1))
+                else:
+                    out.append("\033[%dC" % (start - cursor))
+                for run_start, run_stop, color in row_runs(colors[y, start:stop]):
+                    if color != state:
+                        state = color
+                        out.append(self.sgr(int(fg[y, start + run_start]), int(bg[y, start + run_start])))
+                    out.append(line[start + run_start:start + run_stop])
+                cursor = stop
+        out.append("\033[0m\0338")
+        return "".join(out)
+
+    def snapshot(self, grid, max_y=None, max_x=None):
+        # standalone text, no cursor moves: one line per row, colors reset at each line end
+        lines = []
+        for y in range(grid.height if max_y is None else max_y):
+            line = grid.row_text(y, 0, max_x)
+            fg, bg = grid.fg[y, :max_x], grid.bg[y, :max_x]
+            colors = (fg.astype(np.int64) << 32) | (bg.astype(np.int64) & 0xffffffff)
+            out = []
+            for start, stop, _ in row_runs(colors):
+                out.append(self.sgr(int(fg[start]), int(bg[start])))
+                out.append(line[start:stop])
+            out.append("\033[0m")
+            lines.append("".join(out))
+        return "\n".join(lines) + "\n"
+
+    def draw(self, grid, max_y, max_x):
+        self.pending = self.encode(grid, max_y, max_x).encode()
+
+    def flush(self):
+        data = self.pending
+        self.pending = b""
+        self.bytes_written += len(data)
+        # looked up late, encoding alone (snapshots) works without a real stdout
+        fd = sys.stdout.fileno() if self.fd is None else self.fd
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
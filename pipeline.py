@@ -0,0 +1,76 @@
+import collections
+import queue
+import threading
+import numpy as np
+
+from cells import CELL_MODES, Resampler, framebuffer_to_cells
+
+
+class FramePipeline:
+    # converts and writes frame N on a worker thread while the main thread draws N+1
+    def __init__(self, output, quantizer, lock, cell_mode="half"):
+        self.output = output
+        self.quantizer = quantizer
+        self.cell_mode = cell_mode
+        self.lock = lock
+        self.frames = queue.Queue(maxsize=1)
+        self.dropped = 0
+        # pixel buffers go back here once written or dropped, so steady state allocates nothing
+        self.free = collections.deque()
+        self.resampler = Resampler()
+        # the output is only touched from the worker: resizes leave a flag and the current
+        # grid, frames rendered into an older grid are dropped
+        self.stale = False
+        self.cells = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def buffer(self, shape):
+        # a pixel buffer for the next frame; ones of an old size are let go
+        while self.free:
+            pixels = self.free.pop()
+            if pixels.shape == shape:
+                return pixels
+        return np.empty(shape, dtype=np.uint8)
+
+    def invalidate(self, cells):
+        self.cells = cells
+        self.stale = True
+
+    def release(self, pixels):
+        self.free.append(pixels)
+
+    def submit(self, pixels, cells, overlays, max_y, max_x):
+        frame = (pixels, cells, overlays, max_y, max_x)
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            # writer is behind, replace the stale frame instead of queueing up latency
+            try:
+                self.release(self.frames.get_nowait()[0])
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            self.frames.put_nowait(frame)
+
+    def run(self):
+        while True:
+            pixels, cells, overlays, max_y, max_x = self.frames.get()
+            if self.stale:
+                self.stale = False
+                self.output.invalidate()
+            if self.cells is not None and cells is not self.cells:
+                self.release(pixels)
+                continue
+            cell_w, cell_h = CELL_MODES[self.cell_mode]
+            fitted = self.resampler(pixels, cells.height * cell_h, cells.width * cell_w)
+            framebuffer_to_cells(fitted, cells, self.quantizer, self.cell_mode)
+            self.release(pixels)
+            for y, x, text, fg, bg in overlays:
+                cells.put_text(y, x, text, fg, bg)
+            self.output.draw(cells, max_y, max_x)
+            with self.lock:
+                # a resize may have cleared the screen meanwhile, an old-size frame must not land on it
+                if self.cells is None or cells is self.cells:
+                    self.output.flush()
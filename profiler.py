@@ -0,0 +1,79 @@
+import collections
+import json
+import time
+import numpy as np
+
+
+class FrameProfiler:
+    STAGES = ("input", "model", "draw", "readback", "convert", "output", "editor", "write")
+
+    def __init__(self, window=120, log_path=None):
+        self.visible = False
+        self.window = window
+        self.history = {stage: collections.deque(maxlen=window) for stage in self.STAGES + ("frame",)}
+        self.current = {}
+        self.frame_index = 0
+        self.last = self.frame_start = 0.0
+
+        self.log = None
+        self.log_format = None
+        if log_path:
+            self.log = open(log_path, "w", buffering=1)
+            self.log_format = "csv" if log_path.endswith(".csv") else "jsonl"
+            if self.log_format == "csv":
+                self.log.write(",".join(("frame", "time") + self.STAGES + ("frame_ms",)) + "\n")
+
+    @property
+    def active(self):
+        # nothing is timed unless the overlay is up or a log is open
+        return self.visible or self.log is not None
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def begin_frame(self):
+        # always stamped, so a frame that turns the overlay on midway is timed from its start
+        self.current = {}
+        self.frame_start = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        # time since the previous mark is charged to stage
+        if not self.active:
+            return
+        now = time.perf_counter()
+        self.current[stage] = self.current.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def end_frame(self, rendered=True):
+        if not self.active or not rendered:
+            return
+        total = self.last - self.frame_start
+        for stage, seconds in self.current.items():
+            self.history[stage].append(seconds)
+        self.history["frame"].append(total)
+        self.frame_index += 1
+
+        if self.log_format == "csv":
+            row = [str(self.frame_index), f"{time.time():.4f}"]
+            row += [f"{self.current[s] * 1000:.4f}" if s in self.current else "" for s in self.STAGES]
+            row.append(f"{total * 1000:.4f}")
+            self.log.write(",".join(row) + "\n")
+        elif self.log_format == "jsonl":
+            record = {"frame": self.frame_index, "time": round(time.time(), 4),
+                      "frame_ms": round(total * 1000, 4)}
+            record.update({s: round(v * 1000, 4) for s, v in self.current.items()})
+            self.log.write(json.dumps(record) + "\n")
+
+    def overlay_lines(self):
+        lines = [f"{'stage':<9}{'avg':>7}{'p95':>7} ms"]
+        for stage in self.STAGES + ("frame",):
+            samples = self.history[stage]
+            if samples:
+                ms = np.array(samples) * 1000
+                lines.append(f"{stage:<9}{ms.mean():>7.2f}{np.percentile(ms, 95):>7.2f}")
+        return lines
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
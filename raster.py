@@ -0,0 +1,277 @@
+import numpy as np
+
+from mesh import perspective_matrix
+
+
+def clip_near(prims, colors):
+    # cut (n, k, 4) clip-space lines or triangles at the near plane z = -w, like gl does;
+    # a triangle with one corner behind it leaves a quad, which goes out as two triangles
+    d = prims[..., 2] + prims[..., 3]
+    inside = d >= 0
+    count = inside.sum(1)
+    k = prims.shape[1]
+    whole = count == k
+    if whole.all():
+        return prims, colors
+    if colors.dtype != np.float32:
+        colors = colors.astype(np.float32)
+
+    def cut(rows, a, b):
+        # where edge a -> b meets the plane, position and color
+        da, db = d[rows, a], d[rows, b]
+        t = (da / (da - db))[:, None]
+        return (prims[rows, a] + (prims[rows, b] - prims[rows, a]) * t,
+                colors[rows, a] + (colors[rows, b] - colors[rows, a]) * t)
+
+    parts = [(prims[whole], colors[whole])]
+    if k == 2:
+        rows = np.flatnonzero(count == 1)
+        behind = inside[rows, 0].astype(np.int64)
+        p, c = cut(rows, 1 - behind, behind)
+        lines, line_colors = prims[rows], colors[rows]
+        lines[np.arange(len(rows)), behind] = p
+        line_colors[np.arange(len(rows)), behind] = c
+        parts.append((lines, line_colors))
+    else:
+        # one corner in front: corners keep their cyclic order so the winding survives
+        rows = np.flatnonzero(count == 1)
+        i = np.argmax(inside[rows], 1)
+        pj, cj = cut(rows, i, (i + 1) % 3)
+        pl, cl = cut(rows, i, (i + 2) % 3)
+        parts.append((np.stack([prims[rows, i], pj, pl], 1), np.stack([colors[rows, i], cj, cl], 1)))
+        # one corner behind
+        rows = np.flatnonzero(count == 2)
+        o = np.argmin(inside[rows], 1)
+        a, b = (o + 1) % 3, (o + 2) % 3
+        pb, cb = cut(rows, b, o)
+        pa, ca = cut(rows, a, o)
+        first, first_color = prims[rows, a], colors[rows, a]
+        parts.append((np.stack([first, prims[rows, b], pb], 1), np.stack([first_color, colors[rows, b], cb], 1)))
+        parts.append((np.stack([first, pb, pa], 1), np.stack([first_color, cb, ca], 1)))
+    return np.concatenate([p for p, _ in parts]), np.concatenate([c for _, c in parts])
+
+
+class SoftwareRasterizer:
+    # max candidate pixels tested per batch of triangles
+    CHUNK = 1 << 20
+    NEAR_W = 1e-5
+
+    def __init__(self, width=1, height=1):
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        self.width, self.height = width, height
+        self.color = np.zeros((height, width, 3), dtype=np.uint8)
+        self.depth = np.full(height * width, np.inf, dtype=np.float32)
+        self.color_scale = 255.0
+
+    def clear(self):
+        self.color[:] = 0
+        self.depth[:] = np.inf
+
+    def to_clip(self, vertices, mvp):
+        # (n, 4) clip coordinates; mvp may be a (k, 4, 4) stack, copies come out one after another
+        mvp = np.asarray(mvp, dtype=np.float32)
+        vertices = vertices.astype(np.float32)
+        if mvp.ndim == 3:
+            return (vertices @ mvp[:, :, :3].transpose(0, 2, 1) + mvp[:, None, :, 3]).reshape(-1, 4)
+        return vertices @ mvp[:, :3].T + mvp[:, 3]
+
+    def to_screen(self, clip):
+        w = clip[:, 3]
+        safe_w = np.where(np.abs(w) < self.NEAR_W, self.NEAR_W, w)
+        ndc = clip[:, :3] / safe_w[:, None]
+        screen = np.empty_like(ndc)
+        screen[:, 0] = (ndc[:, 0] + 1) * 0.5 * self.width
+        screen[:, 1] = (1 - ndc[:, 1]) * 0.5 * self.height
+        screen[:, 2] = ndc[:, 2] * 0.5 + 0.5
+        return screen, w
+
+    def draw(self, mesh, mvp):
+        if mesh is None:
+            return
+        for batch in mesh.batches:
+            batch_mvp = mvp if batch.matrix is None else mvp @ batch.matrix
+            colors = batch.colors
+            if batch.instances is not None:
+                # every instance transformed in one go, then rasterized as a single batch
+                batch_mvp = batch_mvp @ batch.instances
+                colors = np.tile(colors, (len(batch.instances), 1))
+            clip = self.to_clip(batch.vertices, batch_mvp)
+            self.color_scale = 1.0 if colors.dtype == np.uint8 else 255.0
+            if batch.primitive == "points":
+                self.fill_points(*self.to_screen(clip), colors)
+                continue
+            k = 3 if batch.primitive == "triangles" else 2
+            prims, colors = clip_near(clip.reshape(-1, k, 4), colors.reshape(-1, k, 3))
+            screen, w = self.to_screen(prims.reshape(-1, 4))
+            if k == 3:
+                self.fill_triangles(screen.reshape(-1, 3, 3), w.reshape(-1, 3), colors)
+            else:
+                self.fill_lines(screen.reshape(-1, 2, 3), w.reshape(-1, 2), colors)
+
+    def visible(self, screen, w):
+        # drop anything behind the eye or entirely off one side of the view; whatever
+        # crossed the near plane was cut at it already
+        z = screen[..., 2]
+        keep = (w > self.NEAR_W).all(1) & (z <= 1).any(1) & (z >= 0).any(1)
+        keep &= (screen[..., 0] >= 0).any(1) & (screen[..., 0] <= self.width).any(1)
+        keep &= (screen[..., 1] >= 0).any(1) & (screen[..., 1] <= self.height).any(1)
+        return keep
+
+    def fill_triangles(self, tri, w, colors):
+        keep = self.visible(tri, w)
+        tri, colors = tri[keep], colors[keep]
+
+        x0, y0 = tri[:, 0, 0], tri[:, 0, 1]
+        x1, y1 = tri[:, 1, 0], tri[:, 1, 1]
+        x2, y2 = tri[:, 2, 0], tri[:, 2, 1]
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+        keep = np.abs(area) > 1e-9
+        tri, colors, area = tri[keep], colors[keep], area[keep]
+        if not len(tri):
+            return
+
+        # pixel-center bounding boxes
+        xmin = np.clip(np.ceil(tri[:, :, 0].min(1) - 0.5), 0, self.width - 1).astype(np.int64)
+        xmax = np.clip(np.floor(tri[:, :, 0].max(1) - 0.5), 0, self.width - 1).astype(np.int64)
+        ymin = np.clip(np.ceil(tri[:, :, 1].min(1) - 0.5), 0, self.height - 1).astype(np.int64)
+        ymax = np.clip(np.floor(tri[:, :, 1].max(1) - 0.5), 0, self.height - 1).astype(np.int64)
+        bw = np.maximum(xmax - xmin + 1, 0)
+        bh = np.maximum(ymax - ymin + 1, 0)
+        counts = bw * bh
+
+        start = 0
+        total = np.cumsum(counts)
+        while start < len(tri):
+            # take triangles until CHUNK candidate pixels, at least one
+            base = total[start - 1] if start else 0
+            stop = max(int(np.searchsorted(total, base + self.CHUNK, side='right')), start + 1)
+            sl = slice(start, stop)
+            self.fill_triangle_chunk(tri[sl], colors[sl], area[sl], xmin[sl], ymin[sl], bw[sl], counts[sl])
+            start = stop
+
+    def fill_triangle_chunk(self, tri, colors, area, xmin, ymin, bw, counts):
+        n = int(counts.sum())
+        if not n:
+            return
+        # barycentrics as planes l = a*x + b*y + c, so each pixel gathers 6 floats
+        x0, y0 = tri[:, 0, 0], tri[:, 0, 1]
+        x1, y1 = tri[:, 1, 0], tri[:, 1, 1]
+        x2, y2 = tri[:, 2, 0], tri[:, 2, 1]
+        planes = np.stack([y1 - y2, x2 - x1, x1 * y2 - x2 * y1,
+                           y2 - y0, x0 - x2, x2 * y0 - x0 * y2], 1) / area[:, None]
+
+        t = np.repeat(np.arange(len(tri)), counts)
+        offsets = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+        row_w = bw[t]
+        px = xmin[t] + offsets % row_w
+        py = ymin[t] + offsets // row_w
+        cx = px.astype(np.float32) + 0.5
+        cy = py.astype(np.float32) + 0.5
+
+        p = planes[t]
+        l0 = p[:, 0] * cx + p[:, 1] * cy + p[:, 2]
+        l1 = p[:, 3] * cx + p[:, 4] * cy + p[:, 5]
+        l2 = 1 - l0 - l1
+        inside = (l0 >= 0) & (l1 >= 0) & (l2 >= 0)
+
+        t, px, py = t[inside], px[inside], py[inside]
+        l = np.stack([l0[inside], l1[inside], l2[inside]], 1)
+        z = (l * tri[t, :, 2]).sum(1)
+        rgb = np.einsum('ij,ijk->ik', l, colors[t])
+        self.resolve(py * self.width + px, z, rgb)
+
+    def fill_lines(self, lines, w, colors):
+        keep = self.visible(lines, w)
+        lines, colors = lines[keep], colors[keep]
+        if not len(lines):
+            return
+        d = lines[:, 1, :2] - lines[:, 0, :2]
+        # part of each segment on screen (liang-barsky), sampled at one step per pixel
+        start, stop = np.zeros(len(lines)), np.ones(len(lines))
+        origin = lines[:, 0, :2]
+        for axis, size in ((0, self.width), (1, self.height)):
+            for p, q in ((-d[:, axis], origin[:, axis]), (d[:, axis], size - origin[:, axis])):
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    r = q / p
+                start = np.where(p < 0, np.maximum(start, r), start)
+                stop = np.where(p > 0, np.minimum(stop, r), stop)
+                stop = np.where((p == 0) & (q < 0), -1.0, stop)
+        keep = start <= stop
+        lines, colors, d, start, stop = lines[keep], colors[keep], d[keep], start[keep], stop[keep]
+        if not len(lines):
+            return
+        steps = np.ceil(np.abs(d).max(1) * (stop - start)).astype(np.int64) + 1
+        t = np.repeat(np.arange(len(lines)), steps)
+        s = np.arange(len(t)) - np.repeat(np.cumsum(steps) - steps, steps)
+        f = (start[t] + (stop - start)[t] * s / np.maximum(steps[t] - 1, 1)).astype(np.float32)[:, None]
+        p = lines[t, 0] * (1 - f) + lines[t, 1] * f
+        rgb = colors[t, 0] * (1 - f) + colors[t, 1] * f
+        self.fill_fragments(p, rgb)
+
+    def fill_points(self, points, w, colors):
+        keep = w > self.NEAR_W
+        self.fill_fragments(points[keep], colors[keep])
+
+    def fill_fragments(self, p, rgb):
+        px = np.floor(p[:, 0]).astype(np.int64)
+        py = np.floor(p[:, 1]).astype(np.int64)
+        inside = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+        inside &= (p[:, 2] >= 0) & (p[:, 2] <= 1)
+        self.resolve(py[inside] * self.width + px[inside], p[inside, 2], rgb[inside])
+
+    def resolve(self, pix, z, rgb):
+        # nearest fragment per pixel, then depth test against the buffer
+        inside = (z >= 0) & (z <= 1)
+        pix, z, rgb = pix[inside], z[inside], rgb[inside]
+        if not len(pix):
+            return
+        # sort by pixel then quantized depth in one int64 key
+        key = pix.astype(np.int64) << 24 | (z * 0xffffff).astype(np.int64)
+        order = np.argsort(key)
+        pix, z = pix[order], z[order]
+        first = np.ones(len(pix), dtype=bool)
+        first[1:] = pix[1:] != pix[:-1]
+        pix, z, order = pix[first], z[first], order[first]
+
+        closer = z < self.depth[pix]
+        pix, order = pix[closer], order[closer]
+        self.depth[pix] = z[closer]
+        color = self.color.reshape(-1, 3)
+        color[pix] = np.clip(rgb[order] * self.color_scale + 0.5, 0, 255).astype(np.uint8)
+
+
+class SoftwareBackend:
+    name = "software"
+
+    def __init__(self):
+        self.rasterizer = SoftwareRasterizer()
+        self.width = self.height = 0
+
+    def resize(self, width, height, aspect=None):
+        self.width, self.height = width, height
+        self.rasterizer.resize(width, height)
+        self.projection = perspective_matrix(45, aspect or width / height, 0.1, 50.0)
+
+    def draw(self, mesh, modelview):
+        self.rasterizer.clear()
+        self.rasterizer.draw(mesh, self.projection @ modelview)
+
+    def read_pixels(self):
+        return self.rasterizer.color
+
+    def read_pixels_async(self, out=None):
+        # nothing to wait on, but the caller keeps the frame past the next draw
+        if out is None:
+            return self.rasterizer.color.copy()
+        np.copyto(out, self.rasterizer.color)
+        return out
+
+
+def make_backend(name):
+    # gl is imported lazily so the software backend runs without pygame or a GL driver
+    if name == "software":
+        return SoftwareBackend()
+    from glbackend import GLBackend
+    return GLBackend()
@@ -0,0 +1,156 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from cells import CELL_MODES, CellGrid, Quantizer, framebuffer_to_cells
+from jsonstream import file_chunks, iter_model, text_chunks
+from mesh import Mesh, MeshBuilder, camera_matrix, compile_instructions
+from meshfile import MAGIC, load_mesh
+from output import AnsiOutput
+from raster import make_backend
+
+
+def load_model(model):
+    # a Mesh, a parsed model dict, model json text, or a path to model json or a packed mesh file
+    if isinstance(model, Mesh):
+        return model
+    if isinstance(model, dict):
+        return compile_instructions(model.get("instructions", []), model.get("meshes"))
+    if isinstance(model, str) and model.lstrip().startswith("{"):
+        chunks, base_dir = text_chunks(model), None
+    else:
+        with open(model, "rb") as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                return load_mesh(model)
+        chunks, base_dir = file_chunks(model), os.path.dirname(os.path.abspath(model))
+    builder = MeshBuilder(base_dir=base_dir)
+    for key, value in iter_model(chunks):
+        builder.feed(key, value)
+    return builder.build()
+
+
+class Snapshot:
+    # renders models to cell grids or ansi text, no terminal and no event loop; the backend
+    # is set up once and only resized when a different size is asked for
+    def __init__(self, width=80, height=24, backend="software", colors="256", dither=False, cells="half"):
+        self.backend = make_backend(backend)
+        self.quantizer = Quantizer(colors, dither)
+        self.encoder = AnsiOutput(mode=colors)
+        self.cell_mode = cells
+        self.size = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        if self.size == (width, height):
+            return
+        self.size = (width, height)
+        cell_w, cell_h = CELL_MODES[self.cell_mode]
+        # cells are about twice as tall as wide
+        aspect = width / (height * 2)
+        self.backend.resize(width * cell_w, height * cell_h, aspect)
+
+    def grid(self, model, width=None, height=None, **camera):
+        # camera: distance, rotation_x, rotation_y, position_x, position_y, angle (see camera_matrix)
+        if width or height:
+            self.resize(width or self.size[0], height or self.size[1])
+        # pass a Mesh from load_model() to render one model more than once without reparsing it
+        self.backend.draw(load_model(model), camera_matrix(**camera))
+        grid = CellGrid(self.size[1], self.size[0])
+        framebuffer_to_cells(self.backend.read_pixels(), grid, self.quantizer, self.cell_mode)
+        return grid
+
+    def ansi(self, model, width=None, height=None, **camera):
+        return self.encoder.snapshot(self.grid(model, width, height, **camera))
+
+
+def render_grid(model, width=80, height=24, backend="software", colors="256", dither=False,
+                cells="half", **camera):
+    # one-off render; keep a Snapshot around when rendering more than one frame
+    return Snapshot(width, height, backend, colors, dither, cells).grid(model, **camera)
+
+
+def render_ansi(model, width=80, height=24, backend="software", colors="256", dither=False,
+                cells="half", **camera):
+    return Snapshot(width, height, backend, colors, dither, cells).ansi(model, **camera)
+
+
+# per worker process state
+_snapshot = None
+
+
+def init_worker(width, height, backend, colors, dither, cells):
+    global _snapshot
+    _snapshot = Snapshot(width, height, backend, colors, dither, cells)
+
+
+def render_job(job):
+    # every angle of one model into the output directory: (path, frames, seconds, error)
+    path, out_dir, angles, camera = job
+    start = time.perf_counter()
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        mesh = load_model(path)
+        for i in range(angles):
+            text = _snapshot.ansi(mesh, angle=360.0 * i / angles, **camera)
+            suffix = f"-{i:02d}" if angles > 1 else ""
+            with open(os.path.join(out_dir, f"{name}{suffix}.ans"), "w") as f:
+                f.write(text)
+    except Exception as e:
+        return path, 0, time.perf_counter() - start, str(e)
+    return path, angles, time.perf_counter() - start, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render a directory of models to ansi thumbnails")
+    parser.add_argument("models", nargs="+", help="model files, or directories of them")
+    parser.add_argument("--out", default="thumbnails", help="directory for the .ans files")
+    parser.add_argument("--pattern", default=".json", help="file suffix picked up from directories")
+    parser.add_argument("--size", default="60x24", help="thumbnail size, WxH cells")
+    parser.add_argument("--angles", type=int, default=1, help="views per model, evenly spaced around y")
+    parser.add_argument("--distance", type=float, default=5.0)
+    parser.add_argument("--tilt", type=float, default=0.0, help="camera rotation about x, degrees")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backend", choices=["gl", "software"], default="software")
+    parser.add_argument("--colors", choices=Quantizer.MODES, default="256")
+    parser.add_argument("--dither", action="store_true")
+    parser.add_argument("--cells", choices=list(CELL_MODES), default="half")
+    args = parser.parse_args()
+
+    paths = []
+    for entry in args.models:
+        if os.path.isdir(entry):
+            paths.extend(os.path.join(entry, name) for name in sorted(os.listdir(entry))
+                         if name.endswith(args.pattern))
+        else:
+            paths.append(entry)
+    if not paths:
+        parser.error("no models found")
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    os.makedirs(args.out, exist_ok=True)
+
+    camera = {"distance": args.distance, "rotation_x": args.tilt}
+    jobs = [(path, args.out, args.angles, camera) for path in paths]
+    workers = max(1, min(args.workers, len(jobs)))
+    start = time.perf_counter()
+    frames = failed = 0
+    # one backend per worker, set up by the initializer and reused for every model it gets
+    with multiprocessing.get_context("spawn").Pool(
+            workers, init_worker, (width, height, args.backend, args.colors, args.dither, args.cells)) as pool:
+        for path, count, seconds, error in pool.imap_unordered(render_job, jobs):
+            if error:
+                failed += 1
+                print(f"{path}: {error}", file=sys.stderr)
+            else:
+                frames += count
+                print(f"{path}: {count} frames, {seconds * 1000:.0f} ms")
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths) - failed} models, {frames} frames in {elapsed:.2f} s on {workers} workers: "
+          f"{(len(paths) - failed) / elapsed:.1f} models/s, {frames / elapsed:.1f} frames/s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from output import AnsiOutput
+
+
+CLEAR = b"\033[0m\033[H\033[2J"
+
+
+class FrameStream:
+    # encodes each frame once as an ansi diff, the same bytes go to every sink
+    def __init__(self, mode, sinks=()):
+        self.encoder = AnsiOutput(mode=mode)
+        self.sinks = list(sinks)
+
+    def invalidate(self):
+        self.encoder.invalidate()
+
+    def draw(self, grid, max_y, max_x):
+        diff = self.encoder.encode(grid, max_y, max_x).encode()
+        cache = []
+
+        def keyframe():
+            # full repaint for new or lagging viewers, built at most once per frame
+            if not cache:
+                cache.append(CLEAR + self.encoder.encode(grid, max_y, max_x, keyframe=True).encode())
+            return cache[0]
+
+        for sink in self.sinks:
+            sink.write_frame(diff, keyframe)
+
+    def flush(self):
+        pass
+
+    def waiting(self):
+        # a viewer attached and has not had a frame yet
+        return any(sink.waiting() for sink in self.sinks)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class TeeOutput:
+    # screen output plus a frame stream, drop-in for either output class
+    def __init__(self, output, stream):
+        self.output = output
+        self.stream = stream
+
+    def invalidate(self):
+        self.output.invalidate()
+        self.stream.invalidate()
+
+    def draw(self, grid, max_y, max_x):
+        self.output.draw(grid, max_y, max_x)
+        self.stream.draw(grid, max_y, max_x)
+
+    def flush(self):
+        self.output.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+
+class AsciicastSink:
+    # asciicast v2: header line, then [seconds, "o", text] per frame
+    def __init__(self, path, width, height):
+        self.file = open(path, "w")
+        self.start = None
+        header = {"version": 2, "width": width, "height": height,
+                  "timestamp": int(time.time()), "env": {"TERM": "xterm-256color"}}
+        self.file.write(json.dumps(header) + "\n")
+
+    def write_frame(self, diff, keyframe):
+        if self.start is None:
+            self.start = time.monotonic()
+            diff = keyframe()
+        if diff:
+            event = [round(time.monotonic() - self.start, 6), "o", diff.decode()]
+            self.file.write(json.dumps(event) + "\n")
+
+    def waiting(self):
+        return False
+
+    def close(self):
+        self.file.close()
+
+
+class StreamClient:
+    # one viewer; holds at most one unsent frame so a slow reader only ever delays itself
+    def __init__(self, sock):
+        self.sock = sock
+        self.cond = threading.Condition()
+        self.pending = None
+        self.synced = False
+        self.closed = False
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def offer(self, diff, keyframe):
+        with self.cond:
+            if self.closed:
+                return
+            if self.pending is not None or not self.synced:
+                # a diff was skipped (or nothing was ever sent): only a full frame is valid now
+                if self.pending is not None:
+                    self.dropped += 1
+                self.pending = keyframe()
+                self.synced = True
+            elif diff:
+                self.pending = diff
+            else:
+                return
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                data, self.pending = self.pending, None
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def parse_address(address):
+    # unix:/path/to.sock, tcp:host:port, host:port or :port
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith("tcp:"):
+        address = address[4:]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+class BroadcastSink:
+    # fans frames out to every attached viewer over a local socket
+    def __init__(self, address):
+        self.family, self.address = parse_address(address)
+        self.server = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen()
+        self.clients = []
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.clients.append(StreamClient(sock))
+
+    def waiting(self):
+        # new viewers only get their keyframe with the next frame, which an idle ui never renders
+        with self.lock:
+            return any(not c.synced and not c.closed for c in self.clients)
+
+    def write_frame(self, diff, keyframe):
+        with self.lock:
+            self.clients = [c for c in self.clients if not c.closed]
+            clients = list(self.clients)
+        for client in clients:
+            client.offer(diff, keyframe)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+def open_sinks(record=None, serve=None, width=80, height=24):
+    sinks = []
+    if record:
+        sinks.append(AsciicastSink(record, width, height))
+    if serve:
+        sinks.append(BroadcastSink(serve))
+    return sinks
+
+
+def view(address):
+    # minimal viewer, anything that copies the socket to a terminal works too (nc -U, socat)
+    family, target = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(target)
+    out = sys.stdout.buffer
+    out.write(b"\033[?25l")
+    try:
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            out.write(data)
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.write(b"\033[0m\033[?25h\n")
+        out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="watch a renderer started with --serve")
+    parser.add_argument("address", help="unix:/path.sock or [host]:port")
+    view(parser.parse_args().address)
+
+
+if __name__ == "__main__":
+    main()
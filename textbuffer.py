@@ -0,0 +1,215 @@
+import random
+
+
+class _Node:
+    __slots__ = ("text", "prio", "left", "right", "size", "lines")
+
+    def __init__(self, text, prio=None, left=None, right=None):
+        self.text = text
+        self.prio = random.random() if prio is None else prio
+        self.left = left
+        self.right = right
+        self.update()
+
+    def update(self):
+        self.size = len(self.text)
+        self.lines = self.text.count('\n')
+        if self.left:
+            self.size += self.left.size
+            self.lines += self.left.lines
+        if self.right:
+            self.size += self.right.size
+            self.lines += self.right.lines
+
+
+def _merge(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio >= b.prio:
+        a.right = _merge(a.right, b)
+        a.update()
+        return a
+    b.left = _merge(a, b.left)
+    b.update()
+    return b
+
+
+def _split(node, pos):
+    # (first pos chars, rest); a chunk straddling pos is cut in two
+    if node is None:
+        return None, None
+    left_size = node.left.size if node.left else 0
+    if pos <= left_size:
+        a, b = _split(node.left, pos)
+        node.left = b
+        node.update()
+        return a, node
+    pos -= left_size
+    if pos >= len(node.text):
+        a, b = _split(node.right, pos - len(node.text))
+        node.right = a
+        node.update()
+        return node, b
+    rest = _Node(node.text[pos:], node.prio, None, node.right)
+    node.text = node.text[:pos]
+    node.right = None
+    node.update()
+    return node, rest
+
+
+def _rightmost_append(node, text):
+    # append to the last chunk, keeping subtree counts on the spine right
+    if node.right:
+        _rightmost_append(node.right, text)
+    else:
+        node.text += text
+    node.update()
+
+
+def _pop_leftmost(node):
+    # (tree without its first chunk, that chunk's text)
+    if node.left is None:
+        return node.right, node.text
+    node.left, text = _pop_leftmost(node.left)
+    node.update()
+    return node, text
+
+
+def _last_len(node):
+    while node.right:
+        node = node.right
+    return len(node.text)
+
+
+def _first_len(node):
+    while node.left:
+        node = node.left
+    return len(node.text)
+
+
+class TextBuffer:
+    # rope of text chunks in an implicit treap: O(log n) edits and line lookup,
+    # indexable like the old list of lines
+    CHUNK = 1024
+
+    def __init__(self, text=""):
+        chunks = [text[i:i + self.CHUNK] for i in range(0, len(text), self.CHUNK)]
+        self.root = self._build(chunks, 0, len(chunks), 1.0)
+
+    def _build(self, chunks, lo, hi, ceiling):
+        # balanced tree, priorities only need to shrink downwards
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        prio = ceiling * (0.5 + 0.5 * random.random())
+        return _Node(chunks[mid], prio,
+                     self._build(chunks, lo, mid, prio),
+                     self._build(chunks, mid + 1, hi, prio))
+
+    def __len__(self):
+        return (self.root.lines if self.root else 0) + 1
+
+    def __getitem__(self, line):
+        return self.line(line)
+
+    @property
+    def size(self):
+        return self.root.size if self.root else 0
+
+    def chunks(self):
+        # the text as its stored pieces, in order; later edits don't touch the returned list
+        parts = []
+        stack, node = [], self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            parts.append(node.text)
+            node = node.right
+        return parts
+
+    def text(self):
+        return "".join(self.chunks())
+
+    def line_start(self, line):
+        # char offset where line starts
+        if line <= 0:
+            return 0
+        offset, node = 0, self.root
+        while node:
+            left_lines = node.left.lines if node.left else 0
+            if line <= left_lines:
+                node = node.left
+                continue
+            line -= left_lines
+            offset += node.left.size if node.left else 0
+            own = node.text.count('\n')
+            if line <= own:
+                pos = -1
+                for _ in range(line):
+                    pos = node.text.index('\n', pos + 1)
+                return offset + pos + 1
+            line -= own
+            offset += len(node.text)
+            node = node.right
+        raise IndexError("line out of range")
+
+    def line_end(self, line):
+        # offset of the line's '\n', or the end of text for the last line
+        if line + 1 >= len(self):
+            return self.size
+        return self.line_start(line + 1) - 1
+
+    def substring(self, start, stop):
+        parts = []
+        self._collect(self.root, start, stop, parts)
+        return "".join(parts)
+
+    def _collect(self, node, start, stop, parts):
+        if node is None or start >= stop:
+            return
+        left_size = node.left.size if node.left else 0
+        if start < left_size:
+            self._collect(node.left, start, min(stop, left_size), parts)
+        own_start = left_size
+        own_stop = left_size + len(node.text)
+        if start < own_stop and stop > own_start:
+            parts.append(node.text[max(start - own_start, 0):min(stop, own_stop) - own_start])
+        if stop > own_stop:
+            self._collect(node.right, max(start - own_stop, 0), stop - own_stop, parts)
+
+    def line(self, line, limit=None):
+        if not 0 <= line < len(self):
+            raise IndexError("line out of range")
+        start, stop = self.line_start(line), self.line_end(line)
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return self.substring(start, stop)
+
+    def line_length(self, line):
+        return self.line_end(line) - self.line_start(line)
+
+    def _join(self, a, b):
+        # merge, folding b's first chunk into a's last when both are small
+        if a and b and _last_len(a) + _first_len(b) <= self.CHUNK:
+            b, text = _pop_leftmost(b)
+            _rightmost_append(a, text)
+        return _merge(a, b)
+
+    def insert(self, line, col, text):
+        pos = self.line_start(line) + col
+        a, b = _split(self.root, pos)
+        if a is not None and _last_len(a) + len(text) <= self.CHUNK:
+            _rightmost_append(a, text)
+        else:
+            a = _merge(a, _Node(text))
+        self.root = self._join(a, b)
+
+    def delete(self, line, col, count=1):
+        pos = self.line_start(line) + col
+        a, rest = _split(self.root, pos)
+        _, c = _split(rest, count)
+        self.root = self._join(a, c)
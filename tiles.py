@@ -0,0 +1,210 @@
+import atexit
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+
+from cells import CELL_MODES, CellGrid, Quantizer, framebuffer_to_cells, resample_nearest
+from mesh import Batch, Mesh, perspective_matrix, rotate_matrix
+from raster import SoftwareRasterizer
+
+
+def tile_projection(view, tile, aspect):
+    # perspective for the whole view, then rescaled so the tile's part of NDC fills [-1, 1]
+    vy0, vy1, vx0, vx1 = view
+    y0, y1, x0, x1 = tile
+    xa, xb = (2 * (x0 - vx0) / (vx1 - vx0) - 1, 2 * (x1 - vx0) / (vx1 - vx0) - 1)
+    ya, yb = (1 - 2 * (y1 - vy0) / (vy1 - vy0), 1 - 2 * (y0 - vy0) / (vy1 - vy0))
+    s = np.identity(4)
+    s[0, 0], s[0, 3] = 2 / (xb - xa), -(xa + xb) / (xb - xa)
+    s[1, 1], s[1, 3] = 2 / (yb - ya), -(ya + yb) / (yb - ya)
+    return s @ perspective_matrix(45, aspect, 0.1, 50.0)
+
+
+def split(start, stop, parts, align=1):
+    # part boundaries, kept on multiples of align so dither patterns line up
+    edges = [start + (stop - start) * i // parts // align * align for i in range(parts)] + [stop]
+    return [(a, b) for a, b in zip(edges, edges[1:]) if b > a]
+
+
+def cell_arrays(buf, height, width):
+    n = height * width
+    ch = np.ndarray((height, width), np.uint32, buf, 0)
+    fg = np.ndarray((height, width), np.int32, buf, n * 4)
+    bg = np.ndarray((height, width), np.int32, buf, n * 8)
+    return ch, fg, bg
+
+
+class SharedMesh:
+    # vertex and color arrays copied once into shared memory; workers map them by name
+    def __init__(self, mesh, generation):
+        arrays, layout, offset = [], [], 0
+        for batch in mesh.batches:
+            entry = {"primitive": batch.primitive, "matrix": batch.matrix}
+            for name in ("vertices", "colors", "instances"):
+                if getattr(batch, name) is None:
+                    continue
+                array = np.ascontiguousarray(getattr(batch, name))
+                entry[name] = (offset, array.dtype.str, array.shape)
+                arrays.append((offset, array))
+                offset += (array.nbytes + 63) // 64 * 64
+            layout.append(entry)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for start, array in arrays:
+            np.ndarray(array.shape, array.dtype, self.shm.buf, start)[:] = array
+        self.descriptor = (generation, self.shm.name, layout)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# per worker process state
+_meshes = {}
+_cells = {}
+_quantizers = {}
+_rasterizer = None
+
+
+def release(cache):
+    # views into the buffer have to go before the mapping can close
+    for key in list(cache):
+        shm, views = cache.pop(key)
+        del views
+        shm.close()
+
+
+def worker_mesh(descriptor):
+    generation, name, layout = descriptor
+    if generation not in _meshes:
+        release(_meshes)
+        shm = shared_memory.SharedMemory(name=name)
+        batches = []
+        for entry in layout:
+            arrays = {}
+            for field in ("vertices", "colors", "instances"):
+                if field in entry:
+                    offset, dtype, shape = entry[field]
+                    arrays[field] = np.ndarray(shape, np.dtype(dtype), shm.buf, offset)
+            # the rasterizer never reads normals
+            batches.append(Batch(entry["primitive"], arrays["vertices"], arrays["colors"], None,
+                                 entry["matrix"], arrays.get("instances")))
+        _meshes[generation] = (shm, Mesh(batches))
+    return _meshes[generation][1]
+
+
+def worker_cells(name, height, width):
+    if name not in _cells:
+        release(_cells)
+        shm = shared_memory.SharedMemory(name=name)
+        _cells[name] = (shm, cell_arrays(shm.buf, height, width))
+    return _cells[name][1]
+
+
+def render_tile(job):
+    # rasterize one tile and convert it straight into its part of the shared cell grid
+    global _rasterizer
+    y0, y1, x0, x1 = job["tile"]
+    cell_w, cell_h = CELL_MODES[job["cell_mode"]]
+    width = max(1, round((x1 - x0) * cell_w * job["scale"]))
+    height = max(2, round((y1 - y0) * cell_h * job["scale"]))
+    if _rasterizer is None:
+        _rasterizer = SoftwareRasterizer(width, height)
+    elif (_rasterizer.width, _rasterizer.height) != (width, height):
+        _rasterizer.resize(width, height)
+    _rasterizer.clear()
+
+    if job["mesh"] is not None:
+        mesh = worker_mesh(job["mesh"])
+        projection = tile_projection(job["view"], job["tile"], job["aspect"])
+        _rasterizer.draw(mesh, projection @ job["modelview"])
+
+    key = (job["colors"], job["dither"])
+    if key not in _quantizers:
+        _quantizers[key] = Quantizer(*key)
+    ch, fg, bg = worker_cells(job["cells"], *job["grid"])
+    grid = CellGrid.wrap(ch[y0:y1, x0:x1], fg[y0:y1, x0:x1], bg[y0:y1, x0:x1])
+    pixels = resample_nearest(_rasterizer.color, (y1 - y0) * cell_h, (x1 - x0) * cell_w)
+    framebuffer_to_cells(pixels, grid, _quantizers[key], job["cell_mode"])
+    return os.getpid()
+
+
+class TileRenderer:
+    # software rendering split over a process pool: every view is cut into horizontal
+    # strips, workers share the mesh and the cell grid through shared memory
+    def __init__(self, tiles=2, views=1, workers=None):
+        self.tiles = tiles
+        self.views = views
+        workers = workers or min(tiles * views, os.cpu_count() or 1)
+        # spawn, forking after curses, pygame and the watcher thread are up is not safe
+        self.pool = multiprocessing.get_context("spawn").Pool(workers)
+        self.mesh = self.shared_mesh = None
+        self.generation = 0
+        self.cells_shm = None
+        self.shape = None
+        self.pending = None
+        atexit.register(self.close)
+
+    def layout(self, height, width, cell_mode="half"):
+        # [(view rect, [tile rects])] in cells, views side by side; strips start on a row of the
+        # 4-row dither pattern, that is every 2 cells in half mode and every cell in sub-cell modes
+        align = 2 if cell_mode == "half" else 4
+        views = []
+        for vx0, vx1 in split(0, width, self.views):
+            view = (0, height, vx0, vx1)
+            views.append((view, [(y0, y1, vx0, vx1) for y0, y1 in split(0, height, self.tiles, align)]))
+        return views
+
+    def share(self, mesh):
+        if mesh is not self.mesh:
+            if self.shared_mesh is not None:
+                self.shared_mesh.close()
+            self.mesh = mesh
+            self.generation += 1
+            self.shared_mesh = None if mesh is None else SharedMesh(mesh, self.generation)
+        return None if self.shared_mesh is None else self.shared_mesh.descriptor
+
+    def cells(self, height, width):
+        if self.shape != (height, width):
+            if self.cells_shm is not None:
+                self.cells_shm.close()
+                self.cells_shm.unlink()
+            self.cells_shm = shared_memory.SharedMemory(create=True, size=max(height * width * 12, 1))
+            self.shape = (height, width)
+        return self.cells_shm.name
+
+    def draw(self, mesh, modelview, grid, quantizer, cell_mode, scale=1.0):
+        # starts every tile, finish() waits for them
+        descriptor = self.share(mesh)
+        cells = self.cells(grid.height, grid.width)
+        jobs = []
+        for i, (view, tiles) in enumerate(self.layout(grid.height, grid.width, cell_mode)):
+            # extra views orbit the model
+            view_matrix = modelview @ rotate_matrix(360.0 * i / self.views, 0.0, 1.0, 0.0)
+            aspect = (view[3] - view[2]) / ((view[1] - view[0]) * 2)
+            for tile in tiles:
+                jobs.append({"tile": tile, "view": view, "aspect": aspect, "modelview": view_matrix,
+                             "mesh": descriptor, "cells": cells, "grid": self.shape,
+                             "cell_mode": cell_mode, "colors": quantizer.mode,
+                             "dither": quantizer.dither, "scale": scale})
+        self.pending = self.pool.map_async(render_tile, jobs)
+
+    def finish(self, grid):
+        if self.pending is None:
+            return grid
+        self.pending.get()
+        self.pending = None
+        ch, fg, bg = cell_arrays(self.cells_shm.buf, *self.shape)
+        grid.ch[:], grid.fg[:], grid.bg[:] = ch, fg, bg
+        return grid
+
+    def close(self):
+        self.pool.terminate()
+        if self.shared_mesh is not None:
+            self.shared_mesh.close()
+            self.shared_mesh = self.mesh = None
+        if self.cells_shm is not None:
+            self.cells_shm.close()
+            self.cells_shm.unlink()
+            self.cells_shm = self.shape = None
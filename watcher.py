@@ -0,0 +1,143 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+EVENT = struct.Struct("iIII")
+
+
+def _inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    # watches one file off the main thread, hands over fully read, debounced contents
+    def __init__(self, path, loader=None, debounce=0.1, poll_interval=0.25):
+        self.path = os.path.abspath(path)
+        self.directory, self.name = os.path.split(self.path)
+        self.loader = loader or (lambda text: text.split('\n'))
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self.lock = threading.Lock()
+        self.pending = None
+        self.known = self.signature()
+        self.backend = "polling"
+
+        self.wake_r, self.wake_w = os.pipe()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def take(self):
+        # loaded contents of the newest change, or None
+        with self.lock:
+            pending, self.pending = self.pending, None
+        return pending
+
+    def ignore_current(self):
+        # call after writing the file ourselves so the write is not reloaded
+        with self.lock:
+            self.known = self.signature()
+            self.pending = None
+
+    def stop(self):
+        self.running = False
+        os.write(self.wake_w, b"x")
+
+    def reload(self):
+        # False if the file changed while reading, the caller retries later
+        before = self.signature()
+        if before is None or before == self.known:
+            return True
+        try:
+            with open(self.path, 'r') as f:
+                text = f.read()
+        except OSError:
+            return False
+        if self.signature() != before:
+            return False
+
+        loaded = self.loader(text)
+        with self.lock:
+            if self.known == before:
+                return True
+            self.known = before
+            self.pending = loaded
+        return True
+
+    def run(self):
+        libc = _inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+            if fd >= 0 and libc.inotify_add_watch(fd, self.directory.encode(), mask) >= 0:
+                self.backend = "inotify"
+                try:
+                    self.run_inotify(fd)
+                finally:
+                    os.close(fd)
+                return
+            if fd >= 0:
+                os.close(fd)
+        self.run_polling()
+
+    def run_inotify(self, fd):
+        last_event = None
+        while self.running:
+            timeout = None
+            if last_event is not None:
+                timeout = max(0.0, last_event + self.debounce - time.monotonic())
+            readable, _, _ = select.select([fd, self.wake_r], [], [], timeout)
+
+            if fd in readable:
+                try:
+                    data = os.read(fd, 1 << 16)
+                except BlockingIOError:
+                    data = b""
+                offset = 0
+                while offset + EVENT.size <= len(data):
+                    _, _, _, length = EVENT.unpack_from(data, offset)
+                    name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+                    offset += EVENT.size + length
+                    if name.decode(errors="replace") == self.name:
+                        last_event = time.monotonic()
+
+            # writes went quiet for debounce, read it
+            if last_event is not None and time.monotonic() - last_event >= self.debounce:
+                last_event = None if self.reload() else time.monotonic()
+
+    def run_polling(self):
+        changed_at = None
+        while self.running:
+            readable, _, _ = select.select([self.wake_r], [], [], self.poll_interval)
+            if readable:
+                break
+            signature = self.signature()
+            if signature != self.known and changed_at is None:
+                changed_at = time.monotonic()
+            if changed_at is not None and time.monotonic() - changed_at >= self.debounce:
+                changed_at = None if self.reload() else time.monotonic()